@@ -3,12 +3,19 @@
 import argparse
 import asyncio
 import datetime
+import os
 import sys
+import time
 
 import numpy as np
 import requests
 import websockets
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from capture import capture_writer
+from integrator import REDUCERS, integrator
+from spectrum_source import ring_source
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -16,16 +23,64 @@ def parse_args():
     parser.add_argument('--center_freq', type=int, default=int(745e6),
                         help='Center frequency [default=%(default)r]')
     parser.add_argument('--rx_gain', type=int, default=50,
-                        help='RX gain [default=%(default)r]')
+                        help='RX gain, from the ring with --ring [default=%(default)r]')
     parser.add_argument('--samp_rate', type=int, default=int(20e6),
-                        help='Sampling rate [default=%(default)r]')
+                        help='Sampling rate, from the ring with --ring '
+                        '[default=%(default)r]')
     parser.add_argument('--spectrum_rate', type=float, default=5,
-                        help='Spectrum rate [default=%(default)r]')
+                        help='Spectrum rate, from the ring with --ring '
+                        '[default=%(default)r]')
     parser.add_argument('--integrations', type=int, default=50,
-                        help='integrations [default=%(default)r]')
-    parser.add_argument('maiasdr_url', type=str,
+                        help='frames reduced to one recorded spectrum, the '
+                        'decimation in time [default=%(default)r]')
+    parser.add_argument('--reducer', type=str, default='mean',
+                        choices=REDUCERS,
+                        help='reduction of the integrated frames [default=%(default)r]')
+    parser.add_argument('--percentile', type=float, default=90,
+                        help='percentile of the percentile reducer [default=%(default)r]')
+    parser.add_argument('--bin_decimation', type=int, default=1,
+                        help='adjacent bins reduced to one, the decimation in '
+                        'frequency [default=%(default)r]')
+    parser.add_argument('--dtype', type=str, default='float32',
+                        choices=['float32', 'float16'],
+                        help='storage type of the spectra, float16 is stored in dB '
+                        '[default=%(default)r]')
+    parser.add_argument('--compression', type=str, default=None,
+                        choices=['float16', 'uint8'],
+                        help='store zlib compressed chunks of the spectra in dB, '
+                        'quantized to this type [default=%(default)r]')
+    parser.add_argument('--db_step', type=float, default=0.5,
+                        help='dB per step of the uint8 compression, from 0 dB '
+                        '[default=%(default)r]')
+    parser.add_argument('--batch', type=int, default=64,
+                        help='spectra per write (per chunk when compressed), rounded up '
+                        'to whole 4 KiB pages when not compressed '
+                        '[default=%(default)r]')
+    parser.add_argument('--summary_bins', type=int, default=256,
+                        help='bins of the per-chunk max/mean summaries of the '
+                        'capture index, 0 for no index [default=%(default)r]')
+    parser.add_argument('--queue_size', type=int, default=16,
+                        help='batches queued for the writer thread, 0 writes '
+                        'from the receive loop [default=%(default)r]')
+    parser.add_argument('--policy', type=str, default='drop',
+                        choices=['drop', 'block'],
+                        help='when the queue is full, drop spectra or wait for '
+                        'the storage [default=%(default)r]')
+    parser.add_argument('--fsync_interval', type=float, default=None,
+                        help='fsync the capture every this many seconds '
+                        '[default=%(default)r]')
+    parser.add_argument('--max_latency', type=float, default=5.0,
+                        help='write a batch that is not full once its first spectrum '
+                        'is this many seconds old [default=%(default)r]')
+    parser.add_argument('--ring', type=str, default=None,
+                        help='record the frames of this shared memory ring, written '
+                        'by the emitter client, instead of connecting to the radio')
+    parser.add_argument('maiasdr_url', type=str, nargs='?',
                         help='Maia SDR base URL')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.maiasdr_url is None and args.ring is None:
+        parser.error('maiasdr_url or --ring is required')
+    return args
 
 
 def setup_maiasdr(args):
@@ -51,31 +106,88 @@ def setup_maiasdr(args):
         sys.exit(1)
 
 
-async def spectrum_loop(args):
+async def websocket_frames(args):
     ws_url = 'ws:' + ':'.join(args.maiasdr_url.split(':')[1:]) + '/waterfall'
+    # frames are timestamped on the monotonic clock, anchored to the wall clock once
+    offset_ns = time.time_ns() - time.monotonic_ns()
     async with websockets.connect(ws_url) as ws:
-        start = datetime.datetime.utcnow()
-        start = start.isoformat().split('.')[0].replace(':', '_')
-        tstamp_path = f'QO-100_WB_{start}_timestamps'
-        spectrum_path = f'QO-100_WB_{start}_spectrum'
-        with (open(tstamp_path, 'wb') as tstamp_f,
-              open(spectrum_path, 'wb') as spectrum_f):
-            while True:
-                t = np.datetime64(datetime.datetime.utcnow()
-                                  ).astype('datetime64[ns]')
-                specs = []
-                for _ in range(args.integrations):
-                    specs.append(np.frombuffer(await ws.recv(), 'float32'))
-                spec = np.average(specs, axis=0)
-                tstamp_f.write(bytes(t))
-                spec.tofile(spectrum_f)
-                tstamp_f.flush()
-                spectrum_f.flush()
+        while True:
+            spec = np.frombuffer(await ws.recv(), 'float32')
+            yield spec, args.center_freq, time.monotonic_ns() + offset_ns
+
+
+async def ring_frames(args):
+    # views into the ring, they are integrated before the writer overwrites them
+    # frames of the retune settle windows hold energy of two LOs
+    source = ring_source(args.ring, settled_only=True)
+    # the capture header describes the radio of the emitter client, not the defaults here
+    if source.samp_rate is None or source.spectrum_rate is None:
+        print(args.ring + ' does not publish the samp_rate and spectrum_rate of the radio')
+        sys.exit(1)
+    args.samp_rate = int(source.samp_rate)
+    args.spectrum_rate = source.spectrum_rate
+    gain = None
+    async for spec, _ in source.frames():
+        if gain is None and source.gain is not None:
+            gain = args.rx_gain = source.gain
+        if source.gain is not None and source.gain != gain:
+            # frames of a ranged gain (--gain_mode auto) are scaled to the gain of the header
+            spec = spec * np.float32(10 ** ((gain - source.gain) / 10))
+        yield spec, source.lo, source.unix_ns
+
+
+async def spectrum_loop(args):
+    if args.ring is not None:
+        frames = ring_frames(args)
+    else:
+        frames = websocket_frames(args)
+    start = datetime.datetime.utcnow()
+    start = start.isoformat().split('.')[0].replace(':', '_')
+    capture_path = f'QO-100_WB_{start}.maiacap'
+    writer = None
+    stage = None
+    block_lo = None
+    try:
+        async for spec, lo, time_ns in frames:
+            if stage is None:
+                stage = integrator(
+                    spec.size, args.integrations, args.reducer,
+                    args.percentile, args.bin_decimation)
+                writer = capture_writer(
+                    capture_path, lo=lo,
+                    samp_rate=args.samp_rate, bins=stage.out.size,
+                    gain=args.rx_gain, spectrum_rate=args.spectrum_rate,
+                    dtype=args.dtype, batch=args.batch, align=True,
+                    queue_size=args.queue_size, policy=args.policy,
+                    fsync_interval=args.fsync_interval,
+                    max_latency=args.max_latency,
+                    compression=args.compression, db_step=args.db_step,
+                    summary_bins=min(args.summary_bins, stage.out.size) or None,
+                    integrations=args.integrations, reducer=args.reducer,
+                    percentile=args.percentile,
+                    bin_decimation=args.bin_decimation)
+            if lo != block_lo:
+                # a retune (--ring) ends the block, frames of two LOs are not mixed
+                if stage.count > 0:
+                    writer.write(stage.start_ns, block_lo, stage.reduce())
+                block_lo = lo
+            spec = stage.add(spec, time_ns)
+            if spec is not None:
+                writer.write(stage.start_ns, lo, spec)
+            else:
+                # integrated spectra can be minutes apart, the last ones go out after max_latency
+                writer.poll()
+    finally:
+        if writer is not None:
+            writer.close()
+            print(writer.counters())
 
 
 def main():
     args = parse_args()
-    setup_maiasdr(args)
+    if args.ring is None:
+        # with --ring the radio is set up by the emitter client
+        setup_maiasdr(args)
     asyncio.run(spectrum_loop(args))
 
 
@@ -2,12 +2,17 @@
 
 import argparse
 import asyncio
+import os
+import sys
 import threading
 
 import numpy as np
 import matplotlib.pyplot as plt
 import websockets
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from spectrum_source import ring_source
+
 
 async def spectrum_loop(address, line):
     async with websockets.connect(address) as ws:
@@ -16,8 +21,17 @@ async def spectrum_loop(address, line):
             line.set_ydata(10*np.log10(spec))
 
 
+async def ring_loop(name, line):
+    # frames written by the emitter client, no second websocket connection
+    async for spec, _ in ring_source(name).frames():
+        line.set_ydata(10*np.log10(spec))
+
+
 def main_async(args, line):
-    asyncio.run(spectrum_loop(args.ws_address, line))
+    if args.ring is not None:
+        asyncio.run(ring_loop(args.ring, line))
+    else:
+        asyncio.run(spectrum_loop(args.ws_address, line))
 
 
 def prepare_plot():
@@ -33,9 +47,15 @@ def prepare_plot():
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Spectrum plot client for Maia SDR')
-    parser.add_argument('ws_address', type=str,
+    parser.add_argument('ws_address', type=str, nargs='?',
                         help='websocket server address')
-    return parser.parse_args()
+    parser.add_argument('--ring', type=str, default=None,
+                        help='read the frames from this shared memory ring '
+                        'instead of ws_address')
+    args = parser.parse_args()
+    if args.ws_address is None and args.ring is None:
+        parser.error('ws_address or --ring is required')
+    return args
 
 
 def main():
@@ -0,0 +1,213 @@
+"""
+Process pool for the per-hop spectral analysis.
+-------------------
+The receive loop only copies each clean frame into a slot of a shared memory ring and, once
+a hop has dwell_frames of them, submits a job (slot indices, LO) to one of the worker
+processes. The worker averages the slots and returns a compact (excess, peaks, levels) result;
+the slots are reused only after the result is back. The radio is retuned to the next hop as
+soon as a job is submitted, and the sweep decision waits for the results of its hops.
+
+Backpressure: when every slot is held by a pending job, new frames are dropped and counted
+(pool_frames_dropped), so a saturated pool shows up in the metrics instead of as websocket lag.
+
+With the cfar detector each worker keeps its own noise_floor, so the jobs of one LO always go
+to the same worker. The panorama is not kept in this mode, its spectra stay in the workers.
+"""
+
+import collections
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from noise_floor import noise_floor
+from spectrum_engine import spectrum_engine
+
+
+def worker(ring_name, shape, jobs, results, detector, threshold_gain, cfar_margin, min_separation):
+    ring = shared_memory.SharedMemory(name=ring_name)
+    frames = np.ndarray(shape, dtype=np.float32, buffer=ring.buf)
+    engine = spectrum_engine(shape[1])
+    noise = noise_floor(shape[1], margin=cfar_margin) if detector == "cfar" else None
+    results.put(None)  # ready
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            job_id, slots, lo, gain_offset = job
+            start = time.perf_counter()
+            for slot in slots:
+                engine.accumulate(frames[slot])
+            _, _, excess, peaks = engine.detect(
+                lo, threshold_gain, noise, min_separation, gain_offset=gain_offset
+            )
+            levels = engine.levels()
+            engine.reset()
+            results.put((job_id, excess, peaks, levels, time.perf_counter() - start))
+    finally:
+        del frames
+        ring.close()
+
+
+class analysis_pool:
+    def __init__(
+        self,
+        workers=2,
+        n_slots=64,
+        n_bins=4096,
+        detector="fixed",
+        threshold_gain=90,
+        cfar_margin=12,
+        min_separation=16,
+    ):
+        self.ring = shared_memory.SharedMemory(create=True, size=n_slots * n_bins * 4)
+        self.frames = np.ndarray((n_slots, n_bins), dtype=np.float32, buffer=self.ring.buf)
+        self.free = collections.deque(range(n_slots))
+        self.detector = detector
+
+        # spawn: the workers must not inherit the event loop and the control threads
+        context = multiprocessing.get_context("spawn")
+        self.jobs = [context.Queue() for _ in range(workers)]
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=worker,
+                args=(
+                    self.ring.name,
+                    self.frames.shape,
+                    jobs,
+                    self.results,
+                    detector,
+                    threshold_gain,
+                    cfar_margin,
+                    min_separation,
+                ),
+                daemon=True,
+            )
+            for jobs in self.jobs
+        ]
+        for process in self.processes:
+            process.start()
+        # wait for the imports of the workers, so the first hops are not queued behind them
+        for _ in self.processes:
+            self.results.get()
+
+        self.job_counter = 0
+        self.pending = {}  # job id -> slots
+        self.dropped_frames = 0
+        self.max_pending = 0
+
+    def write(self, spec):
+        """
+        Copy a frame into a free slot and return its index, None (frame dropped) if the
+        pool is saturated.
+        """
+        if not self.free:
+            self.dropped_frames = self.dropped_frames + 1
+            return None
+        slot = self.free.popleft()
+        np.copyto(self.frames[slot], spec)
+        return slot
+
+    def release(self, slots):
+        self.free.extend(slots)
+
+    def submit(self, slots, lo, gain_offset=0):
+        job_id = self.job_counter
+        self.job_counter = self.job_counter + 1
+        if self.detector == "cfar":
+            # the noise floor of an LO lives in one worker
+            target = int(round(lo / 1e6)) % len(self.jobs)
+        else:
+            target = job_id % len(self.jobs)
+        self.jobs[target].put((job_id, slots, lo, gain_offset))
+        self.pending[job_id] = slots
+        self.max_pending = max(self.max_pending, len(self.pending))
+        return job_id
+
+    def poll(self):
+        """
+        Return the finished jobs as (job id, excess, (peak bins, dB), (peak dB, median dB),
+        analysis time) without blocking, and free their slots.
+        """
+        finished = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return finished
+            self.release(self.pending.pop(result[0]))
+            finished.append(result)
+
+    def counters(self):
+        return {
+            "pool_pending": len(self.pending),
+            "pool_max_pending": self.max_pending,
+            "pool_free_slots": len(self.free),
+            "pool_frames_dropped": self.dropped_frames,
+            "pool_jobs": self.job_counter,
+        }
+
+    def close(self):
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+        for jobs in self.jobs + [self.results]:
+            jobs.close()
+            jobs.join_thread()
+        del self.frames
+        self.ring.close()
+        self.ring.unlink()
+
+
+async def pooled_receive_loop(source, finder, pool, max_frames=None):
+    """
+    receive_loop of initial_code with the analysis of each hop done by the pool.
+    """
+    metrics = finder.metrics
+    metrics.sources.append(pool.counters)
+    slots = []  # slots of the hop being collected
+    jobs = {}  # job id -> (position in finder.freqs, frame time, LO, gain)
+    sweep_done = False  # last hop of the sweep submitted, waiting for its results
+    done_time = source.clock()
+    frame_counter = 0
+    frames = source.frames()
+    try:
+        async for spec, frame_time in frames:
+            metrics.observe("recv_wait", frame_time - done_time)
+
+            for job_id, excess, peaks, levels, analysis_time in pool.poll():
+                position, hop_time, lo, gain = jobs.pop(job_id)
+                if finder.gain is not None:
+                    finder.gain.update(lo, gain, *levels)
+                finder.record_hop(position, excess, peaks, hop_time)
+                metrics.observe("analysis", analysis_time)
+            if sweep_done and not jobs:
+                sweep_done = False
+                finder.next_hop(frame_time)
+
+            if not sweep_done and finder.settle.is_clean(frame_time):
+                slot = pool.write(spec)
+                if slot is not None:
+                    slots.append(slot)
+                if len(slots) == finder.dwell_frames:
+                    job_id = pool.submit(slots, finder.center_freq, finder.hop_gain - finder.rx_gain)
+                    jobs[job_id] = (finder.index_of_loop, frame_time, finder.center_freq, finder.hop_gain)
+                    slots = []
+                    if finder.index_of_loop == len(finder.freqs) - 1:
+                        sweep_done = True
+                    else:
+                        finder.next_hop(frame_time)
+
+            done_time = source.clock()
+            metrics.observe("processing", done_time - frame_time)
+            metrics.count("frames_received")
+            frame_counter = frame_counter + 1
+            if frame_counter == max_frames:
+                return
+    finally:
+        await frames.aclose()
@@ -0,0 +1,138 @@
+"""
+Capture compression benchmark.
+-------------------
+Writes waterfalls built from the recorded scans in notebooks/data through capture_writer,
+uncompressed and with each compression, and reports per scan and mode:
+ - MB/s of float32 spectra in (encoding and writing, timed on the calling thread)
+ - compression ratio (float32 spectra in / bytes on disk)
+ - largest error of the decoded spectra in dB, over the bins inside the uint8 range (deep
+   noise nulls below db_min are clipped, their fraction is reported), and ms to query one
+   chunk back
+
+The scans hold one (LO, max dB) pair per hop. Each hop becomes --frames_per_hop frames of
+the emulator's frame model (maia_emulator.py): exponential noise at the median level of the
+scan and an emitter at the recorded level in the center bin, so the noise compresses like
+a real waterfall rather than like flat spectra.
+
+Usage: python src/benchmarks/bench_capture.py --frames_per_hop 16 --output bench_capture.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from capture import COMPRESSIONS, capture_writer, open_capture
+from maia_emulator import maia_emulator
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "notebooks", "data")
+
+
+def scan_frames(filename, frames_per_hop, samp_rate):
+    data = np.load(filename)
+    los = np.asarray(data["arr_0"], dtype=np.float64)
+    peaks = np.asarray(data["arr_1"], dtype=np.float64)
+    emulator = maia_emulator(0, float(np.median(peaks)), [])
+    emulator.ad9361["sampling_frequency"] = samp_rate
+    emulator.rng = np.random.default_rng(0)
+    frames = []
+    frame_los = []
+    for lo, peak in zip(los, peaks):
+        emulator.ad9361["rx_lo_frequency"] = lo
+        emulator.emitters = [(lo, peak)]
+        for _ in range(frames_per_hop):
+            frames.append(emulator.make_frame())
+            frame_los.append(lo)
+    return np.array(frames), np.array(frame_los)
+
+
+def bench(frames, los, compression, args, filename):
+    start = time.perf_counter()
+    writer = capture_writer(
+        filename,
+        lo=float(los[0]),
+        samp_rate=args.samp_rate,
+        bins=frames.shape[1],
+        gain=60,
+        spectrum_rate=args.spectrum_rate,
+        batch=args.batch,
+        compression=compression,
+        level=args.level,
+    )
+    for i in range(frames.shape[0]):
+        writer.write(i * int(1e9 / args.spectrum_rate), los[i], frames[i])
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    capture = open_capture(filename)
+    db = 10 * np.log10(frames)
+    in_range = (db >= 0) & (db <= 255 * 0.5)
+    error = np.max(np.abs(10 * np.log10(capture.spectra) - db)[in_range])
+    start = time.perf_counter()
+    capture.query(np.datetime64(0, "ns"), np.datetime64(args.batch * int(1e9 / args.spectrum_rate), "ns"))
+    query_time = time.perf_counter() - start
+    return {
+        "mb_per_s": frames.nbytes / elapsed / 1e6,
+        "ratio": frames.nbytes / os.path.getsize(filename),
+        "max_error_db": float(error),
+        "clipped": float(1 - in_range.mean()) if compression == "uint8" else 0.0,
+        "query_ms": query_time * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture compression benchmark")
+    parser.add_argument(
+        "--frames_per_hop", type=int, default=16, required=False, help="frames per recorded hop [default=%(default)r]"
+    )
+    parser.add_argument(
+        "--samp_rate", type=int, default=int(54e6), required=False, help="sampling rate [default=%(default)r]"
+    )
+    parser.add_argument(
+        "--spectrum_rate", type=float, default=500, required=False, help="spectrum rate [default=%(default)r]"
+    )
+    parser.add_argument(
+        "--batch", type=int, default=64, required=False, help="spectra per chunk [default=%(default)r]"
+    )
+    parser.add_argument("--level", type=int, default=1, required=False, help="zlib level [default=%(default)r]")
+    parser.add_argument(
+        "--scans", type=str, default=os.path.join(DATA, "*.npz"), required=False, help="scans [default=%(default)r]"
+    )
+    parser.add_argument("--output", type=str, default=None, required=False, help="JSON results file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scan in sorted(glob.glob(args.scans)):
+            frames, los = scan_frames(scan, args.frames_per_hop, args.samp_rate)
+            name = os.path.basename(scan)
+            results[name] = {}
+            for compression in (None,) + COMPRESSIONS:
+                result = bench(frames, los, compression, args, os.path.join(directory, "bench.maiacap"))
+                results[name][compression or "none"] = result
+                print(
+                    "%-40s %-8s %8.1f MB/s  ratio %5.2f  max error %6.3f dB  clipped %.1e  query %6.2f ms"
+                    % (
+                        name,
+                        compression or "none",
+                        result["mb_per_s"],
+                        result["ratio"],
+                        result["max_error_db"],
+                        result["clipped"],
+                        result["query_ms"],
+                    )
+                )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
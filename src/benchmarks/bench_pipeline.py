@@ -0,0 +1,197 @@
+"""
+Pipeline benchmark of the emitter finder.
+-------------------
+Drives the receive -> process_measurement -> UDP path of initial_code.py with waterfall
+frames from the emulator's frame model (maia_emulator.py), without a network or a radio:
+retunes are acknowledged immediately, frames arrive as websocket-like bytes objects.
+
+Reports, per run:
+ - frames/s and per-frame latency percentiles of the processing path
+ - bytes allocated per frame (tracemalloc peak above the steady state)
+ - sweep duration for wide and narrow sweeps, in frames and in seconds at --spectrum_rate
+
+Results are written as JSON (with the git commit) so they can be compared across commits.
+
+Usage: python src/benchmarks/bench_pipeline.py --frames 20000 --output bench_pipeline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from initial_code import emitter_finder
+from maia_emulator import maia_emulator
+
+
+class immediate_control:
+    """
+    Applies /api/ad9361 requests to the emulator frame model and acknowledges them at once.
+    """
+
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.request_counter = 0
+
+    def submit(self, path, payload, on_done=None):
+        if path == "/api/ad9361":
+            self.emulator.ad9361.update(payload)
+        self.request_counter = self.request_counter + 1
+        if on_done is not None:
+            on_done(json.dumps(self.emulator.ad9361))
+
+
+def drive(args, emitters, trace):
+    """
+    Run the finder over args.frames frames. With trace, the bytes allocated per frame are
+    measured with tracemalloc, otherwise the per-frame latency.
+    """
+    emulator = maia_emulator(0, args.floor_db, [])
+    emulator.ad9361["sampling_frequency"] = args.samp_rate
+    emulator.rng = np.random.default_rng(0)
+    # a pool of precomputed noise frames, the emitters are added for the current LO
+    noise = [emulator.make_frame() for _ in range(64)]
+
+    finder = emitter_finder(
+        args.center_freq,
+        60,
+        args.bandwidth,
+        args.samp_rate,
+        args.spectrum_rate,
+        None,
+        None,
+        [2800e6, 3800e6],
+        args.threshold_gain,
+        dwell_frames=args.dwell_frames,
+        detector=args.detector,
+    )
+    finder.get_frequencies()
+    finder.UDP_init()
+    finder.control = immediate_control(emulator)
+    virtual_time = [0.0]
+    finder.settle.clock = lambda: virtual_time[0]
+    finder.center_freq = finder.freqs[0]
+    finder.change_center_freq()
+
+    latencies = np.empty(args.frames, dtype=np.int64)
+    allocated = 0
+    sweeps = {"wide": [], "narrow": []}
+    sweep_start = 0
+    sweep_wide = finder.wide
+    plan = finder.freqs
+
+    if trace:
+        tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_of_run = time.perf_counter()
+        for i in range(args.frames):
+            virtual_time[0] = virtual_time[0] + 1 / args.spectrum_rate
+            frame = noise[i % len(noise)]
+            lo = emulator.ad9361["rx_lo_frequency"]
+            for frequency, power in emitters:
+                index = int(round((frequency - lo) / args.samp_rate * frame.size + frame.size / 2))
+                if 0 <= index < frame.size:
+                    frame = frame.copy()
+                    frame[index] = frame[index] + 10 ** (power / 10)
+            message = frame.tobytes()  # what ws.recv() returns
+
+            if trace:
+                tracemalloc.reset_peak()
+                current, _ = tracemalloc.get_traced_memory()
+            start = time.perf_counter_ns()
+            spec = np.frombuffer(message, "float32")
+            finder.process_measurement(spec, virtual_time[0])
+            latencies[i] = time.perf_counter_ns() - start
+            if trace:
+                _, peak = tracemalloc.get_traced_memory()
+                allocated = allocated + peak - current
+
+            # a new plan is built at the end of every sweep
+            if finder.freqs is not plan:
+                sweeps["wide" if sweep_wide else "narrow"].append(i + 1 - sweep_start)
+                sweep_start = i + 1
+                sweep_wide = finder.wide
+                plan = finder.freqs
+        elapsed = time.perf_counter() - start_of_run
+    if trace:
+        tracemalloc.stop()
+    return finder, latencies, allocated / args.frames, sweeps, elapsed
+
+
+def run(args, emitters):
+    finder, latencies, _, sweeps, elapsed = drive(args, emitters, False)
+    _, _, allocated, _, _ = drive(args, emitters, True)
+
+    result = {
+        "frames": args.frames,
+        # includes generating the frames, the latencies only cover the processing path
+        "frames_per_second": args.frames / elapsed,
+        "processing_frames_per_second": args.frames / (latencies.sum() / 1e9),
+        "latency_us": {
+            "p50": float(np.percentile(latencies, 50) / 1e3),
+            "p90": float(np.percentile(latencies, 90) / 1e3),
+            "p99": float(np.percentile(latencies, 99) / 1e3),
+            "max": float(latencies.max() / 1e3),
+        },
+        "allocated_bytes_per_frame": allocated,
+        "retunes": finder.control.request_counter,
+    }
+    for mode, frames in sweeps.items():
+        if frames:
+            result[mode + "_sweeps"] = len(frames)
+            result[mode + "_sweep_frames"] = float(np.mean(frames))
+            result[mode + "_sweep_seconds"] = float(np.mean(frames)) / args.spectrum_rate
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Emitter finder pipeline benchmark")
+    parser.add_argument("--frames", type=int, default=20000, help="frames per run [default=%(default)r]")
+    parser.add_argument("--center_freq", type=float, default=3000e6, help="[default=%(default)r] Hz")
+    parser.add_argument("--bandwidth", type=float, default=54e6, help="[default=%(default)r] Hz")
+    parser.add_argument("--samp_rate", type=float, default=54e6, help="[default=%(default)r] Hz")
+    parser.add_argument("--spectrum_rate", type=float, default=507, help="[default=%(default)r] Hz")
+    parser.add_argument("--threshold_gain", type=float, default=90, help="[default=%(default)r] dB")
+    parser.add_argument("--dwell_frames", type=int, default=2, help="[default=%(default)r]")
+    parser.add_argument("--detector", type=str, default="fixed", choices=["fixed", "cfar"])
+    parser.add_argument("--floor_db", type=float, default=40, help="[default=%(default)r] dB")
+    parser.add_argument("--output", type=str, default="bench_pipeline.json", help="JSON results file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "parameters": vars(args),
+        # no emitter: the finder keeps sweeping; emitter at 3.7 GHz: it switches to narrow mode
+        "search": run(args, []),
+        "track": run(args, [(3.7e9, 95)]),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
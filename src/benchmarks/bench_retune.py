@@ -0,0 +1,102 @@
+"""
+Retune throughput benchmark.
+-------------------
+Sweeps the LO over the frequency range and reports hops per second for
+ - blocking requests.patch per hop (the old change_center_freq)
+ - the persistent keep-alive maia_control client
+
+Usage: python src/benchmarks/bench_retune.py --http_address http://192.168.2.1:8000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from maia_control import maia_control
+
+
+def sweep_frequencies(args):
+    return np.arange(
+        args.frequency_range[0] + args.bandwidth / 2,
+        args.frequency_range[1] - args.bandwidth / 2,
+        args.bandwidth,
+    )
+
+
+def bench_requests(args, freqs):
+    start = time.perf_counter()
+    for freq in freqs:
+        response = requests.patch(
+            args.http_address + "/api/ad9361", json={"rx_lo_frequency": int(freq)}
+        )
+        if response.status_code != 200:
+            print(response.text)
+            sys.exit(1)
+    return len(freqs) / (time.perf_counter() - start)
+
+
+async def bench_control(args, freqs):
+    control = maia_control(args.http_address)
+    await control.connect()
+    start = time.perf_counter()
+    for freq in freqs:
+        status_code, text = await control.patch(
+            "/api/ad9361", {"rx_lo_frequency": int(freq)}
+        )
+        if status_code != 200:
+            print(text)
+            sys.exit(1)
+    elapsed = time.perf_counter() - start
+    await control.close()
+    return len(freqs) / elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Retune throughput benchmark for Maia SDR")
+    parser.add_argument(
+        "--http_address",
+        type=str,
+        default="http://192.168.2.1:8000",
+        help="normal server address",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=54e6,
+        help="hop step [default=%(default)r] Hz",
+    )
+    parser.add_argument(
+        "--frequency_range",
+        type=float,
+        nargs=2,
+        default=[2800e6, 3800e6],
+        help="Frequency range [default=%(default)r] Hz",
+    )
+    parser.add_argument(
+        "--sweeps",
+        type=int,
+        default=5,
+        help="number of full sweeps [default=%(default)r]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    freqs = np.tile(sweep_frequencies(args), args.sweeps)
+
+    before = bench_requests(args, freqs)
+    after = asyncio.run(bench_control(args, freqs))
+    print("hops:", len(freqs))
+    print("requests.patch   : %8.1f hops/s" % before)
+    print("maia_control     : %8.1f hops/s" % after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup time benchmark of the emitter client.
+-------------------
+Starts the local Maia SDR emulator and launches initial_code.py with --max_frames 1 several
+times, reporting the time from process launch to the first processed spectrum. The bare
+interpreter startup and the import time of initial_code are reported for reference.
+
+Usage: python src/benchmarks/bench_startup.py --runs 10
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def wall_time(command, cwd=SRC):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup time benchmark of the emitter client")
+    parser.add_argument("--runs", type=int, default=10, help="launches per measurement [default=%(default)r]")
+    parser.add_argument("--port", type=int, default=8050, help="emulator port [default=%(default)r]")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    address = "127.0.0.1:" + str(args.port)
+    emulator = subprocess.Popen(
+        [sys.executable, "maia_emulator.py", "--port", str(args.port), "--retune_latency", "0"],
+        cwd=SRC,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(1)
+        interpreter = [wall_time([sys.executable, "-c", "pass"]) for _ in range(args.runs)]
+        imports = [wall_time([sys.executable, "-c", "import initial_code"]) for _ in range(args.runs)]
+        first_frame = [
+            wall_time(
+                [
+                    sys.executable,
+                    "initial_code.py",
+                    "--ws_address",
+                    "ws://" + address,
+                    "--http_address",
+                    "http://" + address,
+                    "--spectrum_rate",
+                    "500",
+                    "--max_frames",
+                    "1",
+                ]
+            )
+            for _ in range(args.runs)
+        ]
+    finally:
+        emulator.terminate()
+
+    print("interpreter startup       : %6.1f ms" % (np.median(interpreter) * 1e3))
+    print("import initial_code       : %6.1f ms" % (np.median(imports) * 1e3))
+    print("launch to first spectrum  : %6.1f ms" % (np.median(first_frame) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
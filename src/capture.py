@@ -0,0 +1,542 @@
+"""
+Self-describing capture format for waterfall recordings.
+-------------------
+File layout:
+    b"MAIACAP1"                magic
+    uint32 (little endian)     length of the JSON header
+    JSON header                lo, samp_rate, bins, gain, dtype, spectrum_rate, ...
+    zero padding               up to data_offset (multiple of 4096)
+    records                    fixed size: time (int64, ns since epoch), lo (float64), spectrum
+                               (time is the time of the first frame integrated into the record)
+
+The spectra are linear power, except with dtype float16: linear power above 65504 (48 dB)
+does not fit, so float16 spectra are stored in dB (header units "dB") and converted back by
+the readers.
+
+The records are written in batches (chunks) and can be opened with np.memmap, so hours of
+recording are sliced by time and frequency without being loaded into memory.
+
+With queue_size > 0 the batches are written by a background thread, so slow storage does
+not stall the caller (e.g. the websocket receive loop). The batches are taken from a pool
+that grows up to queue_size + 1 arrays, only while the storage is behind. When the pool is
+exhausted, i.e. the storage is behind by queue_size batches, policy "drop" drops the new
+records (counted) and "block" waits. An error of the writer thread (e.g. disk full) is raised
+by the next write() or by close().
+
+With max_latency, a batch that is not full is written anyway once its first record is
+max_latency s old, so a slow recording (e.g. a few integrated spectra per minute) reaches the
+disk without waiting for a whole batch.
+
+Compressed captures (compression "float16" or "uint8") store the records as a sequence of
+independently decodable chunks instead, one per batch:
+
+    chunk header               b"CHNK", uint32 records, uint32 payload length,
+                               int64 time of the first and of the last record
+    payload                    zlib of the times, the LOs and the spectra in dB, as float16
+                               (low bytes then high bytes, which zlib compresses better)
+                               or as uint8 steps of db_step above db_min (clipped)
+
+The chunk headers are read through a memory map to seek by time without decompressing
+anything, only the chunks of a query are decoded.
+
+With summary_bins, every batch is also indexed in filename + ".idx" (see capture_index.py).
+"""
+
+import json
+import math
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from spectrum_engine import bin_offsets
+
+MAGIC = b"MAIACAP1"
+ALIGNMENT = 4096
+CHUNK = struct.Struct("<4sIIqq")
+CHUNK_MAGIC = b"CHNK"
+COMPRESSIONS = ("float16", "uint8")
+
+
+def record_dtype(bins, dtype):
+    return np.dtype([("time", "<i8"), ("lo", "<f8"), ("spectrum", np.dtype(dtype).newbyteorder("<"), (bins,))])
+
+
+def spectrum_power(spectra, header):
+    """
+    Linear power of spectra as stored in a capture with this header.
+    """
+    if header.get("units") == "dB":
+        return 10 ** (spectra.astype(np.float32) / 10)
+    return spectra
+
+
+def encode_chunk(records, compression, level=1, db_min=0.0, db_step=0.5):
+    db = 10 * np.log10(np.maximum(records["spectrum"], np.float32(1e-20)))
+    if compression == "float16":
+        spectra = np.ascontiguousarray(db.astype("<f2").view(np.uint8).reshape(-1, 2).T)
+    else:
+        spectra = np.clip(np.rint((db - db_min) / db_step), 0, 255).astype(np.uint8)
+    payload = zlib.compress(records["time"].tobytes() + records["lo"].tobytes() + spectra.tobytes(), level)
+    header = CHUNK.pack(CHUNK_MAGIC, records.size, len(payload), records["time"][0], records["time"][-1])
+    return header + payload
+
+
+def decode_chunk(payload, count, header):
+    """
+    Records of one compressed chunk, with the spectra back in linear power (float32).
+    """
+    bins = header["bins"]
+    data = zlib.decompress(payload)
+    records = np.empty(count, dtype=record_dtype(bins, "float32"))
+    records["time"] = np.frombuffer(data, "<i8", count)
+    records["lo"] = np.frombuffer(data, "<f8", count, 8 * count)
+    if header["compression"] == "float16":
+        planes = np.frombuffer(data, np.uint8, 2 * count * bins, 16 * count).reshape(2, -1)
+        db = np.ascontiguousarray(planes.T).view("<f2").astype(np.float32)
+    else:
+        db = np.frombuffer(data, np.uint8, count * bins, 16 * count) * np.float32(header["db_step"])
+        db += np.float32(header["db_min"])
+    records["spectrum"] = 10 ** (db.reshape(count, bins) / 10)
+    return records
+
+
+class capture_writer:
+    def __init__(
+        self,
+        filename,
+        lo,
+        samp_rate,
+        bins,
+        gain,
+        spectrum_rate,
+        dtype="float32",
+        batch=64,
+        align=False,
+        queue_size=0,
+        policy="drop",
+        fsync_interval=None,
+        compression=None,
+        level=1,
+        db_min=0.0,
+        db_step=0.5,
+        summary_bins=None,
+        max_latency=None,
+        **extra,
+    ):
+        self.header = dict(
+            version=1,
+            lo=lo,
+            samp_rate=samp_rate,
+            bins=bins,
+            gain=gain,
+            spectrum_rate=spectrum_rate,
+            dtype=np.dtype(dtype).name,
+            **extra,
+        )
+        if compression is not None:
+            if compression not in COMPRESSIONS:
+                raise ValueError("unknown compression " + repr(compression))
+            # the batches stay float32, the spectra are quantized when a chunk is written
+            dtype = "float32"
+            align = False
+            self.header.update(dtype=dtype, compression=compression)
+            if compression == "uint8":
+                self.header.update(db_min=db_min, db_step=db_step)
+        elif np.dtype(dtype) == np.float16:
+            self.header.update(units="dB")
+        self.db = self.header.get("units") == "dB"
+        self.compression = compression
+        self.level = level
+        header = json.dumps(self.header).encode()
+        data_offset = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+        self.header["data_offset"] = data_offset
+
+        self.f = open(filename, "wb")
+        self.f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.f.write(bytes(data_offset - self.f.tell()))
+        self.index = None
+        if summary_bins is not None:
+            from capture_index import index_writer
+
+            self.index = index_writer(filename + ".idx", bins, summary_bins)
+
+        record = record_dtype(bins, dtype)
+        if align:
+            # full batches are a multiple of the page size, so every write is aligned
+            unit = ALIGNMENT // math.gcd(record.itemsize, ALIGNMENT)
+            batch = -(-batch // unit) * unit
+        # one chunk of records, written with a single call when full
+        self.record = record
+        self.batch_size = batch
+        self.batch = np.zeros(batch, dtype=record)
+        self.count = 0
+        self.max_latency = max_latency  # s, None to write full batches only
+        self.clock = time.monotonic
+        self.batch_start = None  # clock time of the first record of the batch
+
+        self.policy = policy
+        self.fsync_interval = fsync_interval  # s, None for no fsync
+        self.last_fsync = time.monotonic()
+        self.written = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.fsyncs = 0
+        self.max_write_time = 0
+        self.error = None  # exception of the writer thread
+        self.thread = None
+        if queue_size > 0:
+            self.queue_size = queue_size
+            self.pool_size = 1  # batches allocated so far
+            self.free = queue.Queue()
+            self.full = queue.Queue()
+            self.thread = threading.Thread(target=self.writer, name="capture_writer", daemon=True)
+            self.thread.start()
+
+    def write(self, time, lo, spectrum):
+        """
+        Append one spectrum. time is np.datetime64 or int ns since epoch.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.batch is None and not self.next_batch():
+            self.dropped = self.dropped + 1
+            return
+        if self.count == 0:
+            self.batch_start = self.clock()
+        record = self.batch[self.count]
+        record["time"] = np.datetime64(time, "ns").astype(np.int64)
+        record["lo"] = lo
+        if self.db:
+            record["spectrum"] = 10 * np.log10(np.maximum(spectrum, np.float32(1e-20)))
+        else:
+            record["spectrum"] = spectrum
+        self.count = self.count + 1
+        if self.count == self.batch.size:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        """
+        Write the partial batch once its first record is max_latency s old. Called by write(),
+        and by callers whose records are further apart than max_latency.
+        """
+        if self.max_latency is not None and self.count > 0 and self.clock() - self.batch_start >= self.max_latency:
+            # a partial batch is written as one shorter chunk, later writes are no longer
+            # page aligned (align), which only costs speed at rates where batches fill anyway
+            self.flush()
+
+    def next_batch(self):
+        try:
+            self.batch = self.free.get_nowait()
+        except queue.Empty:
+            if self.pool_size <= self.queue_size:
+                self.batch = np.zeros(self.batch_size, dtype=self.record)
+                self.pool_size = self.pool_size + 1
+                return True
+            if self.policy != "block":
+                return False
+            self.batch = self.free.get()
+        return True
+
+    def flush(self):
+        if self.thread is None:
+            if self.count > 0:
+                self.write_batch(self.batch[: self.count])
+                self.count = 0
+            self.f.flush()
+        elif self.count > 0:
+            self.full.put((self.batch, self.count))
+            self.batch = None
+            self.count = 0
+            self.next_batch()
+
+    def write_batch(self, records):
+        start = time.perf_counter()
+        offset = self.f.tell()
+        if self.compression is None:
+            self.f.write(records.data)
+            self.bytes_written = self.bytes_written + records.nbytes
+            length = records.nbytes
+        else:
+            chunk = encode_chunk(
+                records, self.compression, self.level, self.header.get("db_min"), self.header.get("db_step")
+            )
+            self.f.write(chunk)
+            self.bytes_written = self.bytes_written + len(chunk)
+            offset = offset + CHUNK.size
+            length = len(chunk) - CHUNK.size
+        # every batch, full or flushed at max_latency, is handed to the OS right away, and the
+        # index never points past the data
+        self.f.flush()
+        if self.index is not None:
+            self.index.append(self.written, offset, length, records, spectrum_power(records["spectrum"], self.header))
+            self.index.flush()
+        self.written = self.written + records.size
+        if self.fsync_interval is not None and time.monotonic() - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.f.fileno())
+            self.last_fsync = time.monotonic()
+            self.fsyncs = self.fsyncs + 1
+        self.max_write_time = max(self.max_write_time, time.perf_counter() - start)
+
+    def writer(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                break
+            batch, count = item
+            if self.error is None:
+                try:
+                    self.write_batch(batch[:count])
+                except Exception as error:
+                    # raised by the next write() or close(); the batches are still returned,
+                    # so a producer blocked on the pool wakes up
+                    self.error = error
+            self.free.put(batch)
+
+    def counters(self):
+        return {
+            "records_written": self.written,
+            "bytes_written": self.bytes_written,
+            "records_dropped": self.dropped,
+            "fsyncs": self.fsyncs,
+            "max_write_time": self.max_write_time,
+        }
+
+    def close(self):
+        self.flush()
+        if self.thread is not None:
+            self.full.put(None)
+            self.thread.join()
+        if self.error is None and self.fsync_interval is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+        self.f.close()
+        if self.index is not None:
+            self.index.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_header(filename, magic=MAGIC):
+    with open(filename, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(filename + " is not a capture file")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    header["data_offset"] = -(-(len(magic) + 4 + length) // ALIGNMENT) * ALIGNMENT
+    return header
+
+
+def header_frequencies(header, lo=None):
+    """
+    Frequency of each bin for lo, by default the LO in the header. With bin_decimation, the
+    center of each group of reduced bins.
+    """
+    if lo is None:
+        lo = header["lo"]
+    decimation = header.get("bin_decimation", 1)
+    offsets = bin_offsets(header["samp_rate"], header["bins"])
+    return lo + offsets + (decimation - 1) / 2 * header["samp_rate"] / (header["bins"] * decimation)
+
+
+def window_lo(los):
+    """
+    LO of the records of a frequency query. The bins of the records only line up if they
+    share one LO, a window recorded from a sweep (e.g. record-wb-transponder.py --ring) is
+    queried per LO with capture_index instead.
+    """
+    distinct = np.unique(los)
+    if distinct.size > 1:
+        raise ValueError("the window holds records of %d LOs, use capture_index.query" % distinct.size)
+    return float(distinct[0]) if distinct.size else None
+
+
+def open_capture(filename):
+    """
+    Reader of an uncompressed or a compressed capture.
+    """
+    if "compression" in read_header(filename):
+        return compressed_reader(filename)
+    return capture_reader(filename)
+
+
+class capture_reader:
+    def __init__(self, filename):
+        self.header = read_header(filename)
+        self.dtype = record_dtype(self.header["bins"], self.header["dtype"])
+
+        # a partially written last record (e.g. power loss) is ignored
+        with open(filename, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell() - self.header["data_offset"]
+        self.records = np.memmap(
+            filename,
+            dtype=self.dtype,
+            mode="r",
+            offset=self.header["data_offset"],
+            shape=(max(size, 0) // self.dtype.itemsize,),
+        )
+
+    def __len__(self):
+        return self.records.size
+
+    @property
+    def timestamps(self):
+        return self.records["time"].view("datetime64[ns]")
+
+    @property
+    def lo(self):
+        return self.records["lo"]
+
+    @property
+    def spectra(self):
+        return spectrum_power(self.records["spectrum"], self.header)
+
+    def frequencies(self, lo=None):
+        return header_frequencies(self.header, lo)
+
+    def time_slice(self, start=None, stop=None):
+        """
+        Record index slice of start <= time < stop (np.datetime64 or None).
+        """
+        times = self.records["time"]
+        first = 0 if start is None else int(np.searchsorted(times, np.datetime64(start, "ns").astype(np.int64)))
+        last = times.size if stop is None else int(np.searchsorted(times, np.datetime64(stop, "ns").astype(np.int64)))
+        return slice(first, last)
+
+    def frequency_slice(self, low=None, high=None, lo=None):
+        """
+        Bin slice of low <= frequency < high for lo, by default the LO in the header.
+        """
+        frequencies = self.frequencies(lo)
+        first = 0 if low is None else int(np.searchsorted(frequencies, low))
+        last = frequencies.size if high is None else int(np.searchsorted(frequencies, high))
+        return slice(first, last)
+
+    def query(self, start=None, stop=None, low=None, high=None):
+        """
+        Return (timestamps, frequencies, spectra) of a time/frequency window. The spectra are
+        a view of the memory map (converted when stored in dB), only the requested part is
+        read from disk. The frequencies
+        are those of the LO of the records with low or high (ValueError if the window holds
+        several LOs), of the LO in the header otherwise.
+        """
+        rows = self.time_slice(start, stop)
+        lo = None
+        if low is not None or high is not None:
+            lo = window_lo(self.lo[rows])
+        bins = self.frequency_slice(low, high, lo)
+        return (
+            self.timestamps[rows],
+            self.frequencies(lo)[bins],
+            spectrum_power(self.records["spectrum"][rows, bins], self.header),
+        )
+
+
+class compressed_reader:
+    """
+    Reader of a compressed capture. The chunk headers are indexed when the file is opened,
+    the chunks are decompressed when they are read.
+    """
+
+    def __init__(self, filename):
+        self.header = read_header(filename)
+        self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+
+        offsets = []
+        lengths = []
+        counts = []
+        first = []
+        last = []
+        offset = self.header["data_offset"]
+        while offset + CHUNK.size <= self.data.size:
+            magic, count, length, start, stop = CHUNK.unpack_from(self.data, offset)
+            if magic != CHUNK_MAGIC or offset + CHUNK.size + length > self.data.size:
+                # a partially written last chunk (e.g. power loss) is ignored
+                break
+            offsets.append(offset + CHUNK.size)
+            lengths.append(length)
+            counts.append(count)
+            first.append(start)
+            last.append(stop)
+            offset = offset + CHUNK.size + length
+        self.offsets = np.array(offsets, dtype=np.int64)  # of the payloads
+        self.lengths = np.array(lengths, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.first = np.array(first, dtype=np.int64)  # ns, time of the first and last record
+        self.last = np.array(last, dtype=np.int64)
+        self.decoded = None
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def chunk(self, index):
+        start = self.offsets[index]
+        return decode_chunk(self.data[start : start + self.lengths[index]], self.counts[index], self.header)
+
+    @property
+    def records(self):
+        # every chunk, decoded once; query() only decodes the chunks it needs
+        if self.decoded is None:
+            self.decoded = np.concatenate([self.chunk(i) for i in range(self.offsets.size)])
+        return self.decoded
+
+    @property
+    def timestamps(self):
+        return self.records["time"].view("datetime64[ns]")
+
+    @property
+    def lo(self):
+        return self.records["lo"]
+
+    @property
+    def spectra(self):
+        return self.records["spectrum"]
+
+    def frequencies(self, lo=None):
+        return header_frequencies(self.header, lo)
+
+    def chunk_slice(self, start=None, stop=None):
+        """
+        Slice of the chunks with records in start <= time < stop (np.datetime64 or None).
+        """
+        first = 0 if start is None else int(np.searchsorted(self.last, np.datetime64(start, "ns").astype(np.int64)))
+        last = self.first.size if stop is None else int(np.searchsorted(self.first, np.datetime64(stop, "ns").astype(np.int64)))
+        return slice(first, max(first, last))
+
+    frequency_slice = capture_reader.frequency_slice
+
+    def query(self, start=None, stop=None, low=None, high=None):
+        """
+        Return (timestamps, frequencies, spectra) of a time/frequency window, decoding only
+        the chunks that overlap it. Frequencies as in capture_reader.query.
+        """
+        chunks = range(self.offsets.size)[self.chunk_slice(start, stop)]
+        if len(chunks) == 0:
+            records = np.empty(0, dtype=record_dtype(self.header["bins"], "float32"))
+        else:
+            records = np.concatenate([self.chunk(i) for i in chunks])
+        times = records["time"]
+        keep = np.ones(times.size, dtype=bool)
+        if start is not None:
+            keep &= times >= np.datetime64(start, "ns").astype(np.int64)
+        if stop is not None:
+            keep &= times < np.datetime64(stop, "ns").astype(np.int64)
+        records = records[keep]
+        lo = None
+        if low is not None or high is not None:
+            lo = window_lo(records["lo"])
+        bins = self.frequency_slice(low, high, lo)
+        return records["time"].view("datetime64[ns]"), self.frequencies(lo)[bins], records["spectrum"][:, bins]
@@ -0,0 +1,277 @@
+"""
+Per-chunk index of a capture.
+-------------------
+Written next to the capture (filename + ".idx") by capture_writer, one entry per chunk, in
+the same layout as the capture itself (magic, JSON header, fixed size entries from
+data_offset), so it is read with np.memmap:
+
+    first, count               records of the chunk
+    offset, length             bytes of the chunk in the capture (compressed: the payload)
+    start, stop                time of the first and the last record, ns since epoch
+    lo_min, lo_max             LOs of the records
+    max, mean                  linear power of the chunk per group of bins / summary_bins
+                               adjacent bins, relative to the LO of the records
+
+capture_index answers time/frequency queries from the entries and only reads the records of
+the chunks that match, as views of a memory map of the capture (decoded when compressed).
+max_power() uses the per-chunk max as an upper bound and stops reading chunks as soon as no
+remaining chunk can beat the best power found, so a query over days of recording reads a
+handful of chunks. Captures recorded without an index are indexed with build_index().
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from capture import (
+    ALIGNMENT,
+    decode_chunk,
+    header_frequencies,
+    open_capture,
+    read_header,
+    record_dtype,
+    spectrum_power,
+)
+
+MAGIC = b"MAIAIDX1"
+
+
+def index_dtype(summary_bins):
+    return np.dtype(
+        [
+            ("first", "<i8"),
+            ("count", "<i8"),
+            ("offset", "<i8"),
+            ("length", "<i8"),
+            ("start", "<i8"),
+            ("stop", "<i8"),
+            ("lo_min", "<f8"),
+            ("lo_max", "<f8"),
+            ("max", "<f4", (summary_bins,)),
+            ("mean", "<f4", (summary_bins,)),
+        ]
+    )
+
+
+class index_writer:
+    def __init__(self, filename, bins, summary_bins=256):
+        if bins % summary_bins != 0:
+            raise ValueError("summary_bins must divide the number of bins")
+        self.header = dict(version=1, bins=bins, summary_bins=summary_bins)
+        header = json.dumps(self.header).encode()
+        data_offset = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        self.f = open(filename, "wb")
+        self.f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.f.write(bytes(data_offset - self.f.tell()))
+        self.entry = np.zeros(1, dtype=index_dtype(summary_bins))
+
+    def append(self, first, offset, length, records, spectra=None):
+        """
+        Index the records of one chunk, written at offset (length bytes) of the capture.
+        spectra is their linear power, by default records["spectrum"].
+        """
+        if spectra is None:
+            spectra = records["spectrum"]
+        entry = self.entry[0]
+        entry["first"] = first
+        entry["count"] = records.size
+        entry["offset"] = offset
+        entry["length"] = length
+        entry["start"] = records["time"][0]
+        entry["stop"] = records["time"][-1]
+        entry["lo_min"] = records["lo"].min()
+        entry["lo_max"] = records["lo"].max()
+        groups = spectra.reshape(records.size, self.header["summary_bins"], -1)
+        entry["max"] = groups.max(axis=(0, 2))
+        entry["mean"] = groups.mean(axis=(0, 2), dtype=np.float64)
+        self.f.write(self.entry.data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def build_index(filename, summary_bins=256, chunk=64):
+    """
+    Index a capture recorded without one, in chunks of chunk records when it is not
+    compressed.
+    """
+    capture = open_capture(filename)
+    header = capture.header
+    writer = index_writer(filename + ".idx", header["bins"], summary_bins)
+    if "compression" in header:
+        first = 0
+        for i in range(capture.offsets.size):
+            writer.append(first, capture.offsets[i], capture.lengths[i], capture.chunk(i))
+            first = first + capture.counts[i]
+    else:
+        itemsize = capture.dtype.itemsize
+        for first in range(0, len(capture), chunk):
+            records = capture.records[first : first + chunk]
+            writer.append(
+                first,
+                header["data_offset"] + first * itemsize,
+                records.nbytes,
+                records,
+                spectrum_power(records["spectrum"], header),
+            )
+    writer.close()
+
+
+class capture_index:
+    def __init__(self, filename):
+        self.header = read_header(filename)
+        index_header = read_header(filename + ".idx", MAGIC)
+        self.summary_bins = index_header["summary_bins"]
+        dtype = index_dtype(self.summary_bins)
+        size = os.path.getsize(filename + ".idx") - index_header["data_offset"]
+        # a partially written last entry is ignored
+        self.entries = np.memmap(
+            filename + ".idx",
+            dtype=dtype,
+            mode="r",
+            offset=index_header["data_offset"],
+            shape=(max(size, 0) // dtype.itemsize,),
+        )
+
+        self.compressed = "compression" in self.header
+        if self.compressed:
+            self.data = np.memmap(filename, dtype=np.uint8, mode="r")
+        else:
+            self.dtype = record_dtype(self.header["bins"], self.header["dtype"])
+            size = os.path.getsize(filename) - self.header["data_offset"]
+            self.data = np.memmap(
+                filename,
+                dtype=self.dtype,
+                mode="r",
+                offset=self.header["data_offset"],
+                shape=(max(size, 0) // self.dtype.itemsize,),
+            )
+
+        # frequency offset of each bin from the LO, and of the first and last bin of each group
+        self.offsets = header_frequencies(self.header) - self.header["lo"]
+        group = self.header["bins"] // self.summary_bins
+        self.group_low = self.offsets[::group]
+        self.group_high = self.offsets[group - 1 :: group]
+
+    def __len__(self):
+        return self.entries.size
+
+    def chunks(self, start=None, stop=None, low=None, high=None):
+        """
+        Chunks with records in start <= time < stop and bins in low <= frequency < high.
+        """
+        match = np.ones(self.entries.size, dtype=bool)
+        if start is not None:
+            match &= self.entries["stop"] >= np.datetime64(start, "ns").astype(np.int64)
+        if stop is not None:
+            match &= self.entries["start"] < np.datetime64(stop, "ns").astype(np.int64)
+        if low is not None:
+            match &= self.entries["lo_max"] + self.offsets[-1] >= low
+        if high is not None:
+            match &= self.entries["lo_min"] + self.offsets[0] < high
+        return np.flatnonzero(match)
+
+    def read(self, chunk):
+        """
+        Records of a chunk: a view of the memory map, or decoded when compressed.
+        """
+        entry = self.entries[chunk]
+        if self.compressed:
+            start = int(entry["offset"])
+            return decode_chunk(self.data[start : start + int(entry["length"])], int(entry["count"]), self.header)
+        return self.data[int(entry["first"]) : int(entry["first"] + entry["count"])]
+
+    def window(self, chunk, start=None, stop=None, low=None, high=None):
+        """
+        Yield (timestamps, frequencies, spectra) of the records of one chunk in the window,
+        per LO within the chunk.
+        """
+        records = self.read(chunk)
+        times = records["time"]
+        first = 0 if start is None else int(np.searchsorted(times, np.datetime64(start, "ns").astype(np.int64)))
+        last = times.size if stop is None else int(np.searchsorted(times, np.datetime64(stop, "ns").astype(np.int64)))
+        records = records[first:last]
+        # runs of records with the same LO
+        lo = records["lo"]
+        edges = np.concatenate(([0], np.flatnonzero(lo[1:] != lo[:-1]) + 1, [lo.size]))
+        for run_start, run_stop in zip(edges[:-1], edges[1:]):
+            if run_start == run_stop:
+                continue
+            frequencies = lo[run_start] + self.offsets
+            bins = slice(
+                0 if low is None else int(np.searchsorted(frequencies, low)),
+                frequencies.size if high is None else int(np.searchsorted(frequencies, high)),
+            )
+            if bins.start == bins.stop:
+                continue
+            run = records[run_start:run_stop]
+            yield (
+                run["time"].view("datetime64[ns]"),
+                frequencies[bins],
+                spectrum_power(run["spectrum"][:, bins], self.header),
+            )
+
+    def query(self, start=None, stop=None, low=None, high=None):
+        """
+        Yield (timestamps, frequencies, spectra) of the time/frequency window, per chunk and
+        per LO within the chunk. The spectra of an uncompressed capture are views of the
+        memory map (converted when stored in dB), only the requested part is read from disk.
+        """
+        for chunk in self.chunks(start, stop, low, high):
+            yield from self.window(chunk, start, stop, low, high)
+
+    def max_power(self, start=None, stop=None, low=None, high=None):
+        """
+        Return (power, time, frequency) of the strongest bin of the window, None if it is
+        empty. Chunks are read in the order of their summary max and only while they can
+        still hold a stronger bin.
+        """
+        chunks = self.chunks(start, stop, low, high)
+        if chunks.size == 0:
+            return None
+        entries = self.entries[chunks]
+        # summary groups overlapping [low, high), all groups for chunks of several LOs
+        lo = entries["lo_min"]
+        first = np.zeros(chunks.size, dtype=np.int64)
+        last = np.full(chunks.size, self.summary_bins, dtype=np.int64)
+        single = entries["lo_min"] == entries["lo_max"]
+        if low is not None:
+            first[single] = np.searchsorted(self.group_high, low - lo[single])
+        if high is not None:
+            last[single] = np.searchsorted(self.group_low, high - lo[single])
+        groups = np.arange(self.summary_bins)
+        overlap = (groups[None, :] >= first[:, None]) & (groups[None, :] < last[:, None])
+        bounds = np.where(overlap, entries["max"], -np.inf).max(axis=1)
+
+        best = None
+        for i in np.argsort(bounds)[::-1]:
+            if best is not None and bounds[i] <= best[0]:
+                break
+            for times, frequencies, spectra in self.window(chunks[i], start, stop, low, high):
+                if spectra.size == 0:
+                    continue
+                row, column = np.unravel_index(int(np.argmax(spectra)), spectra.shape)
+                if best is None or spectra[row, column] > best[0]:
+                    best = (float(spectra[row, column]), times[row], float(frequencies[column]))
+        return best
+
+    def overview(self, start=None, stop=None):
+        """
+        (start times, lo_min, lo_max, max, mean) of the chunks in start <= time < stop, from
+        the index only, e.g. to plot days of recording.
+        """
+        entries = self.entries[self.chunks(start, stop)]
+        return (
+            entries["start"].view("datetime64[ns]"),
+            entries["lo_min"],
+            entries["lo_max"],
+            entries["max"],
+            entries["mean"],
+        )
+
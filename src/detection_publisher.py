@@ -0,0 +1,139 @@
+"""
+Detection publisher for the direction finding consumers.
+-------------------
+Replaces the ad-hoc "frequency,gain\\n" UDP strings with a compact fixed-size binary record:
+
+    datagram: header  "<2sBB"   magic b"EF", version, number of records
+              records "<IddfBBI"  sequence, unix time (s), frequency (Hz), power (dB), mode,
+                                  radio index, track id (NO_TRACK if not tracked, ids wrap
+                                  modulo NO_TRACK)
+
+The sequence number increases by one per record, so a consumer detects lost datagrams from
+the gaps. Records are packed into one preallocated buffer and sent without copies, up to
+batch records per datagram (a partial batch is sent once it is max_delay s old), to every
+destination of a unicast list; multicast groups are allowed. close() sends the last partial
+batch.
+
+format="text" keeps the legacy strings for the existing consumers.
+"""
+
+import socket
+import struct
+import time
+
+HEADER = struct.Struct("<2sBB")
+RECORD = struct.Struct("<IddfBBI")
+MAGIC = b"EF"
+VERSION = 3
+NO_TRACK = 0xFFFFFFFF
+
+# mode of a record
+WIDE = 0  # detected during the wide sweep
+NARROW = 1  # detected during the narrow sweep
+COAST = 2  # missed in this sweep, last detection repeated
+LOST = 3  # signal lost, back to the wide sweep
+
+
+class detection_publisher:
+    def __init__(self, destinations, format="text", batch=1, max_delay=None, multicast_ttl=1):
+        self.destinations = destinations  # [(host, port)]
+        self.format = format
+        self.batch = batch
+        self.max_delay = max_delay  # s
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if any(is_multicast(host) for host, _ in destinations):
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+
+        self.buffer = bytearray(HEADER.size + batch * RECORD.size)
+        self.view = memoryview(self.buffer)
+        self.count = 0  # records in the buffer
+        self.first_time = None  # time of the oldest record in the buffer
+
+        self.sequence = 0
+        self.sent_datagrams = 0
+
+    def publish(self, frequency, power, mode, timestamp=None, radio=0, track=None):
+        if self.format == "text":
+            if mode == LOST:
+                message = str(frequency) + ",1500\n"  # lost message with last frequency
+            else:
+                message = str(frequency) + "," + str(power) + "\n"
+            self.send(message.encode())
+            return
+
+        now = time.time() if timestamp is None else timestamp
+        RECORD.pack_into(
+            self.buffer,
+            HEADER.size + self.count * RECORD.size,
+            self.sequence,
+            now,
+            frequency,
+            float("nan") if power is None else power,
+            mode,
+            radio,
+            NO_TRACK if track is None else track % NO_TRACK,
+        )
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.count = self.count + 1
+        if self.first_time is None:
+            self.first_time = now
+        if self.count == self.batch:
+            self.flush()
+        else:
+            self.poll(now)
+
+    def poll(self, now=None):
+        """
+        Send a partial batch whose oldest record is older than max_delay.
+        """
+        if self.first_time is None or self.max_delay is None:
+            return
+        if (time.time() if now is None else now) - self.first_time >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if self.count == 0:
+            return
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, self.count)
+        self.send(self.view[: HEADER.size + self.count * RECORD.size])
+        self.count = 0
+        self.first_time = None
+
+    def send(self, datagram):
+        for destination in self.destinations:
+            self.sock.sendto(datagram, destination)
+        self.sent_datagrams = self.sent_datagrams + 1
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_multicast(host):
+    try:
+        return 224 <= int(host.split(".")[0]) <= 239
+    except ValueError:
+        return False
+
+
+def parse_destination(text):
+    host, _, port = text.rpartition(":")
+    return host, int(port)
+
+
+def unpack_records(datagram):
+    """
+    Decode a binary datagram into a list of
+    (sequence, time, frequency, power, mode, radio, track).
+    """
+    magic, version, count = HEADER.unpack_from(datagram, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a detection datagram")
+    return [RECORD.unpack_from(datagram, HEADER.size + i * RECORD.size) for i in range(count)]
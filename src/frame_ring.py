@@ -0,0 +1,185 @@
+"""
+Shared memory ring of waterfall frames.
+-------------------
+The process holding the websocket writes every frame once into a named shared memory ring,
+and any number of other processes (detector, spectrum viewers, recorder) read the frames in
+place, so one websocket feed serves every consumer. There is one writer and no locks:
+
+    header  int64[4]        magic, n_slots, n_bins, sequence number of the last written frame
+    params  float64[2]      samp_rate (Hz) and spectrum_rate (frames/s) of the radio, 0 if unknown
+    meta    n_slots records sequence <i8, lo <f8 (Hz), monotonic time <f8 (s), unix time <i8 (ns),
+            settled <i8, gain <f8 (dB)
+    frames  float32[n_slots, n_bins]
+
+lo and gain are the LO and rx_gain acknowledged by the radio when the frame arrived (NaN if
+unknown), so readers such as the recorder describe the frames without their own radio
+settings. settled is 0 for the frames of the retune settle window, which may hold energy of
+the previous LO.
+
+Sequence numbers start at 1 and frame seq lives in slot seq % n_slots. The writer sets the
+sequence of the slot to -1, copies the frame and the metadata, stores the sequence in the
+slot and then in the header. A reader accepts a slot only if it holds the expected sequence
+(seqlock); a reader that fell more than n_slots behind skips to the oldest frame still in the
+ring and counts the lost ones.
+
+A frame returned by read() is a view into the ring, valid until the writer comes around to
+its slot again (n_slots / spectrum rate s later); valid(seq) tells whether it still is.
+"""
+
+import asyncio
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = 0x474E49524149414D  # "MAIARING"
+META_DTYPE = np.dtype(
+    [
+        ("sequence", "<i8"),
+        ("lo", "<f8"),
+        ("monotonic", "<f8"),
+        ("unix_ns", "<i8"),
+        ("settled", "<i8"),
+        ("gain", "<f8"),
+    ]
+)
+META_OFFSET = 4 * 8 + 2 * 8  # header and params
+
+
+class frame_ring:
+    def __init__(self, name, n_slots=256, n_bins=4096, create=False, samp_rate=0, spectrum_rate=0):
+        self.name = name
+        self.create = create
+        if create:
+            size = META_OFFSET + n_slots * META_DTYPE.itemsize + n_slots * n_bins * 4
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = attach(name)
+        self.header = np.ndarray(4, dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = (MAGIC, n_slots, n_bins, 0)
+        elif self.header[0] != MAGIC:
+            raise ValueError(name + " is not a frame ring")
+        self.n_slots = int(self.header[1])
+        self.n_bins = int(self.header[2])
+        self.params = np.ndarray(2, dtype=np.float64, buffer=self.shm.buf, offset=4 * 8)
+        if create:
+            self.params[:] = (samp_rate, spectrum_rate)
+        self.samp_rate = float(self.params[0])
+        self.spectrum_rate = float(self.params[1])
+
+        self.meta = np.ndarray(self.n_slots, dtype=META_DTYPE, buffer=self.shm.buf, offset=META_OFFSET)
+        self.frames = np.ndarray(
+            (self.n_slots, self.n_bins),
+            dtype=np.float32,
+            buffer=self.shm.buf,
+            offset=META_OFFSET + self.n_slots * META_DTYPE.itemsize,
+        )
+        # field views, so write() does not index the structured array by name per frame
+        self.sequences = self.meta["sequence"]
+        self.los = self.meta["lo"]
+        self.monotonic = self.meta["monotonic"]
+        self.unix_ns = self.meta["unix_ns"]
+        self.settled = self.meta["settled"]
+        self.gains = self.meta["gain"]
+
+    def last(self):
+        """
+        Sequence number of the newest frame, 0 if nothing was written yet.
+        """
+        return int(self.header[3])
+
+    def write(self, spec, lo, monotonic, settled=True, gain=None):
+        """
+        Append a frame, return its sequence number. Only the creating process writes.
+        """
+        seq = int(self.header[3]) + 1
+        slot = seq % self.n_slots
+        self.sequences[slot] = -1
+        np.copyto(self.frames[slot], spec)
+        self.los[slot] = np.nan if lo is None else lo
+        self.monotonic[slot] = monotonic
+        self.unix_ns[slot] = time.time_ns()
+        self.settled[slot] = settled
+        self.gains[slot] = np.nan if gain is None else gain
+        self.sequences[slot] = seq
+        self.header[3] = seq
+        return seq
+
+    def valid(self, seq):
+        return self.sequences[seq % self.n_slots] == seq
+
+    def read(self, seq):
+        """
+        Return (frame view, lo, monotonic time, unix time ns, settled, gain) of frame seq, None
+        if its slot does not hold it (being written, or already overwritten).
+        """
+        slot = seq % self.n_slots
+        if self.sequences[slot] != seq:
+            return None
+        record = (
+            self.frames[slot],
+            float(self.los[slot]),
+            float(self.monotonic[slot]),
+            int(self.unix_ns[slot]),
+            bool(self.settled[slot]),
+            float(self.gains[slot]),
+        )
+        if self.sequences[slot] != seq:
+            return None
+        return record
+
+    def close(self):
+        del self.header, self.params, self.meta, self.frames
+        del self.sequences, self.los, self.monotonic, self.unix_ns, self.settled, self.gains
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 the resource tracker of a reader would unlink the ring at exit
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class ring_reader:
+    def __init__(self, ring, start="latest"):
+        self.ring = ring
+        # "latest": from the next frame on, "oldest": from the oldest frame still in the ring
+        last = ring.last()
+        self.next = last + 1 if start == "latest" else max(last - ring.n_slots + 2, 1)
+        self.lost_frames = 0
+
+    def poll(self):
+        """
+        Return (seq, frame view, lo, monotonic time, unix time ns, settled, gain) of the next
+        frame, None if the writer has not produced it yet.
+        """
+        while True:
+            last = self.ring.last()
+            if self.next > last:
+                return None
+            oldest = last - self.ring.n_slots + 2  # the slot after last may be being written
+            if self.next < oldest:
+                self.lost_frames = self.lost_frames + oldest - self.next
+                self.next = oldest
+            record = self.ring.read(self.next)
+            seq = self.next
+            self.next = self.next + 1
+            if record is None:
+                self.lost_frames = self.lost_frames + 1
+                continue
+            return (seq,) + record
+
+    async def frames(self, poll_interval=0.0005):
+        while True:
+            record = self.poll()
+            if record is None:
+                await asyncio.sleep(poll_interval)
+                continue
+            yield record
@@ -0,0 +1,68 @@
+"""
+Automatic gain ranging per band.
+-------------------
+Keeps the waterfall of every band inside the usable dynamic range of the AD9361 from the
+levels the finder already measures on each hop:
+
+ - peak above ceiling_db: the strongest signal is close to clipping, the gain goes down
+ - median below floor_db while the peak is well below the ceiling: the noise floor is
+   close to the quantization floor, the gain goes up
+
+The gain of a band (LOs within band_width of each other) is cached, and is sent to the radio
+in the same PATCH as the next retune into the band, so ranging costs no extra requests. The
+levels of a hop are in dB at the gain it was measured with; the finder scales the reported
+powers back to the startup gain, so thresholds and the published powers do not move with it.
+"""
+
+
+class gain_ranger:
+    def __init__(
+        self,
+        gain,
+        min_gain=0,
+        max_gain=70,
+        step=3,
+        ceiling_db=110,
+        floor_db=35,
+        band_width=20e6,
+    ):
+        self.start_gain = gain  # dB, gain of a band that was not ranged yet
+        self.min_gain = min_gain
+        self.max_gain = max_gain
+        self.step = step  # dB per change
+        self.ceiling_db = ceiling_db
+        self.floor_db = floor_db
+        self.band_width = band_width  # Hz
+        self.gains = {}  # band -> gain
+        self.changes = 0
+
+    def band(self, center_freq):
+        return int(round(center_freq / self.band_width))
+
+    def gain(self, center_freq):
+        return self.gains.get(self.band(center_freq), self.start_gain)
+
+    def update(self, center_freq, gain, peak_db, floor_db):
+        """
+        Range the band of center_freq from one hop measured at gain. Returns the new gain of
+        the band, None if it does not change.
+        """
+        band = self.band(center_freq)
+        current = self.gains.get(band, self.start_gain)
+        if gain != current:
+            # measured before the last change of this band took effect
+            return None
+        if peak_db > self.ceiling_db:
+            new = max(current - self.step, self.min_gain)
+        elif floor_db < self.floor_db and peak_db + 2 * self.step < self.ceiling_db:
+            new = min(current + self.step, self.max_gain)
+        else:
+            return None
+        if new == current:
+            return None
+        self.gains[band] = new
+        self.changes = self.changes + 1
+        return new
+
+    def counters(self):
+        return {"gain_changes": self.changes, "gain_bands": len(self.gains)}
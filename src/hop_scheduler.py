@@ -0,0 +1,60 @@
+"""
+Adaptive hop scheduler for the wide sweep.
+-------------------
+Keeps a running statistic (exponential moving average of the hop peak in dB relative to the
+detection threshold) and the last detection of every hop of the uniform plan. Hops close to
+the threshold or with a recent detection are visited on every pass and first; quiet hops are
+visited once every max_skip passes, staggered so that each pass carries a share of them.
+Every hop is still visited at least once every max_skip passes, so the coverage of the range
+is kept.
+"""
+
+import numpy as np
+
+
+class hop_scheduler:
+    def __init__(self, n_hops, max_skip=4, margin=6, memory=3, alpha=0.25):
+        self.max_skip = max_skip  # quiet hops are visited once every max_skip passes
+        self.margin = margin  # dB, hops within margin of the threshold count as active
+        self.memory = memory  # passes a detection keeps its hop active
+        self.alpha = alpha  # averaging constant of the hop excess
+
+        self.mean_excess = np.full(n_hops, np.nan)  # dB above the detection threshold
+        self.last_detection = np.full(n_hops, -(memory + 1))
+        self.next_visit = np.arange(n_hops) % max_skip + 1  # staggered
+        self.pass_number = 0
+
+    def record(self, hop, excess):
+        """
+        Update the statistic of a hop (index in the uniform plan) after its dwell.
+        excess is the hop peak above the detection threshold in dB, positive if detected.
+        """
+        if np.isnan(self.mean_excess[hop]):
+            self.mean_excess[hop] = excess
+        else:
+            self.mean_excess[hop] += self.alpha * (excess - self.mean_excess[hop])
+        if excess > 0:
+            self.last_detection[hop] = self.pass_number
+
+    def plan(self):
+        """
+        Return the indices of the hops to visit in the next pass, active hops first.
+        """
+        self.pass_number = self.pass_number + 1
+
+        unknown = np.isnan(self.mean_excess)
+        active = (self.mean_excess > -self.margin) | (
+            self.pass_number - self.last_detection <= self.memory
+        )
+        due = self.next_visit <= self.pass_number
+        selected = active | due | unknown
+        if not selected.any():
+            # fewer hops than max_skip, visit the most overdue one
+            selected[np.argmin(self.next_visit)] = True
+            due = selected
+        self.next_visit[selected & (active | due)] = self.pass_number + self.max_skip
+
+        active_hops = np.flatnonzero(active)
+        active_hops = active_hops[np.argsort(-self.mean_excess[active_hops])]
+        other_hops = np.flatnonzero(selected & ~active)
+        return np.concatenate((active_hops, other_hops))
@@ -33,15 +33,35 @@ Spectrum Rate = 100-120 # Hz, MAX~203 Hz
 
 import argparse
 import asyncio
+import itertools
 import threading
 
 import numpy as np
-import websockets
-import requests
 
-import socket
 import sys
 
+from gain_control import gain_ranger
+from detection_publisher import COAST, LOST, NARROW, WIDE, detection_publisher, parse_destination
+from maia_control import maia_control
+from settle_tracker import settle_tracker
+from hop_scheduler import hop_scheduler
+from metrics import metrics
+from noise_floor import noise_floor
+from panorama import panorama
+from radio_state import radio_state
+from spectrum_engine import spectrum_engine
+from spectrum_source import ring_tee, websocket_source
+from sweep_plan import plan_cache
+from tracker import track_table
+
+
+MAX_RF_BANDWIDTH = int(20e6)  # Hz
+
+
+def rf_bandwidth(bandwidth):
+    # the hop spacing of the wide mode can exceed the analog filter range of the AD9361
+    return min(int(bandwidth), MAX_RF_BANDWIDTH)
+
 
 class emitter_finder:
     def __init__(
@@ -55,6 +75,21 @@ class emitter_finder:
         http_address,
         frequency_range,
         threshold_gain,
+        settle_time=0.002,
+        dwell_frames=2,
+        panorama_file=None,
+        max_skip=4,
+        detector="fixed",
+        cfar_margin=12,
+        max_tracks=8,
+        track_gate=1e6,
+        min_separation=16,
+        lookout_hops=1,
+        gain_mode="manual",
+        gain_limits=(0, 70),
+        gain_step=3,
+        gain_ceiling=110,
+        gain_floor=35,
     ):
         self.center_freq = center_freq
         self.rx_gain = rx_gain
@@ -68,125 +103,235 @@ class emitter_finder:
         self.threshold_gain = threshold_gain
         self.wide = True  # if False it will be narrow a.k.a frequencies around center
         self.freqs = None
-        self.measured_frequency_list = []
-        self.measured_power_list = []
-        self.measurement_counter = False
-        self.measurement_previous = None  # np.zeros((1,1),dtype=np.float32)
-        self.measurement_current = None  # np.zeros((1,1),dtype=np.float32)
+        self.step = None  # distance between the hops of self.freqs
+        # cached wide and narrow plans, and the (plan, row) of each hop of self.freqs
+        self.plans = plan_cache(samp_rate)
+        self.hops = []
+        # wide mode: uniform plan and the scheduler choosing which of its hops to visit
+        self.wide_plan = None
+        self.wide_freqs = None
+        self.scheduler = None
+        self.schedulers = {}  # wide plan -> its scheduler, kept across mode switches
+        self.max_skip = max_skip
+        self.hop_indices = None  # index in wide_freqs of each hop of self.freqs
+        # every peak above the threshold of the hops of this sweep, for the tracker
+        self.peak_frequency_list = []
+        self.peak_power_list = []
+        self.peak_time_list = []
+        self.min_separation = min_separation  # bins between two peaks of one hop
+        self.tracks = track_table(max_tracks, track_gate, max_misses=5)
+        # narrow mode: wide hops added to each sweep in turn, so new emitters are still found
+        self.lookout_hops = lookout_hops
+        self.lookout_index = 0
+        self.dwell_frames = dwell_frames  # clean frames averaged on each hop
+        self.engine = spectrum_engine()  # linear power accumulator of the current hop
+        # frames inside the settle window after a retune still hold the previous LO
+        self.settle = settle_tracker(settle_time, 1 / spectrum_rate)
+        # shadow of the radio settings, the changes of one hop go out as one PATCH
+        self.radio_state = radio_state(
+            on_request=self.settle.retune_requested, on_acknowledged=self.settle.retune_acknowledged
+        )
+        # stitched spectrum of the whole frequency range, updated on every hop
+        self.panorama = panorama(frequency_range, samp_rate)
+        self.panorama_file = panorama_file
+        # "fixed": threshold_gain, "cfar": per-bin floor + cfar_margin (threshold_gain while warming up)
+        self.noise = noise_floor(margin=cfar_margin) if detector == "cfar" else None
 
         self.index_of_loop = 0  # this is to loop around the frequencies
         self.found_gain = None  # 0
         self.found_frequency = frequency_range[0]  # self.center_freq
 
-        self.sock = None
-        self.server_address = None
+        self.publisher = None  # detection_publisher, created by UDP_init
+        self.control = None  # maia_control, created on the event loop
+        self.metrics = metrics()
+        self.metrics.sources.append(
+            lambda: {
+                "frames_clean": self.settle.clean_frames,
+                "frames_dropped": self.settle.dropped_frames,
+            }
+        )
+        self.metrics.sources.append(self.radio_state.counters)
+        # "manual": rx_gain everywhere, "auto": ranged per band, powers scaled back to rx_gain
+        self.gain = None
+        if gain_mode == "auto":
+            self.gain = gain_ranger(rx_gain, gain_limits[0], gain_limits[1], gain_step, gain_ceiling, gain_floor)
+            self.metrics.sources.append(self.gain.counters)
+        self.hop_gain = rx_gain  # gain the current hop is measured at
+        self.sweep_time = None  # frame time of the end of the previous sweep
         # self.profiler_counter = 0
-        self.lost_counter = 0 #ilhami
+        self.radio = 0  # index of the radio when several are coordinated
 
     def get_frequencies(self):
-        lower_limit = self.frequency_range[0]
-        upper_limit = self.frequency_range[1]
-        bandwith = self.bandwidth
-
-        freqs = np.arange(
-            lower_limit + bandwith / 2, upper_limit - bandwith / 2, bandwith / 1
-        )
-        self.freqs = freqs
+        # the hops are no further apart than the applied RF bandwidth, so the trimmed hops
+        # still cover the whole range
+        bandwith = min(self.bandwidth, self.rf_bandwidth())
+
+        plan = self.plans.get(self.frequency_range, bandwith, 1)
+        if plan is not self.wide_plan:
+            self.wide_plan = plan
+            self.wide_freqs = plan.los
+            if plan not in self.schedulers:
+                self.schedulers[plan] = hop_scheduler(len(plan), self.max_skip)
+            self.scheduler = self.schedulers[plan]
+
+        # visit the likely-active hops on every pass and the quiet ones less often
+        self.hop_indices = self.scheduler.plan()
+        self.freqs = plan.los[self.hop_indices]
+        self.hops = [(plan, row) for row in self.hop_indices]
+        self.step = bandwith / 1
         return
 
     def get_frequencies_around_center(self):
-        center_freq = self.found_frequency
         bandwith = self.bandwidth
 
-        freqs = np.arange(
-            max(center_freq - bandwith * 0.5, self.frequency_range[0]),
-            min(center_freq + bandwith * 1, self.frequency_range[1]),
-            bandwith / 2,
-        )
+        tracks = self.tracks.active()
+        centers = self.tracks.frequency[tracks] if tracks.size else [self.found_frequency]
+        plans = [
+            self.plans.get(self.frequency_range, bandwith, 0.5, center_freq, self.rf_bandwidth())
+            for center_freq in centers
+        ]
+        # one dwell of every track in turn, LOs already in the plan are not visited twice
+        hops = []
+        for rows in itertools.zip_longest(*[[(plan, row) for row in range(len(plan))] for plan in plans]):
+            for hop in rows:
+                if hop is None:
+                    continue
+                lo = hop[0].los[hop[1]]
+                if all(abs(lo - plan.los[row]) >= bandwith / 4 for plan, row in hops):
+                    hops.append(hop)
+        if self.wide_plan is not None:
+            for _ in range(self.lookout_hops):
+                hops.append((self.wide_plan, self.lookout_index % len(self.wide_plan)))
+                self.lookout_index = self.lookout_index + 1
         # print(freqs)
-        self.freqs = freqs
+        self.hops = hops
+        self.freqs = np.array([plan.los[row] for plan, row in hops])
+        self.step = bandwith / 2
         return
-    
 
-    def process_measurement(self, measurement):
-        if self.measurement_counter == False:
-            self.measurement_counter = True
-            self.measurement_previous = measurement
+    def process_measurement(self, measurement, frame_time):
+        if not self.settle.is_clean(frame_time):
             return
-        
-        self.measurement_counter = False
-        # average the two measurements
-        self.measurement_current = np.divide(
-            np.add(self.measurement_previous, measurement), 2
-        )
 
-        max_power = np.max(self.measurement_current)
-        # TODO: check frequency bins
-        frequency_max_power = (
-            self.center_freq
-        )  # + np.argmax(self.measurement_current) - (self.measurement_current.size/2)
+        # measurement is in linear power, only the peak is converted to dB
+        self.engine.accumulate(measurement)
+        if self.engine.count < self.dwell_frames:
+            return
 
-        self.measured_power_list.append(max_power)
-        self.measured_frequency_list.append(frequency_max_power)
+        excess, peaks = self.analyse_hop()
+        self.record_hop(self.index_of_loop, excess, peaks, frame_time)
+        self.next_hop(frame_time)
+
+    def analyse_hop(self):
+        """
+        dB above the threshold of the strongest bin of the accumulated hop, and the
+        (fractional bins, dB) of all its peaks above the threshold.
+        """
+        gain_offset = self.hop_gain - self.rx_gain
+        _, _, excess, peaks = self.engine.detect(
+            self.center_freq,
+            self.threshold_gain,
+            self.noise,
+            self.min_separation,
+            gain_offset=gain_offset,
+        )
+        if self.gain is not None:
+            self.gain.update(self.center_freq, self.hop_gain, *self.engine.levels())
+
+        self.panorama.update(
+            self.center_freq,
+            self.engine.accumulator,
+            10 ** (-gain_offset / 10) / self.engine.count,
+            self.rf_bandwidth(),
+            self.step,
+        )
+        self.engine.reset()
+        return excess, peaks
 
+    def record_hop(self, position, excess, peaks, frame_time):
+        """
+        Store the result of the hop at position of self.freqs.
+        """
+        # frequency of the (sub-bin) peaks, those outside the RF bandwidth are dropped
+        peak_bins, peak_powers = peaks
+        plan, row = self.hops[position]
+        index = peak_bins.astype(np.int64)
+        keep = plan.keep[row, index]
+        peak_bins, peak_powers, index = peak_bins[keep], peak_powers[keep], index[keep]
+        self.peak_frequency_list.extend(
+            plan.frequencies[row, index] + (peak_bins - index) * plan.bin_width
+        )
+        self.peak_power_list.extend(peak_powers)
+        self.peak_time_list.extend([frame_time] * peak_powers.size)
+        self.metrics.count("hops")
+        self.publisher.poll()
+        if self.wide == True:
+            self.scheduler.record(self.hop_indices[position], excess)
+
+    def next_hop(self, frame_time):
+        """
+        Retune to the next hop, deciding on the sweep first if this was its last hop.
+        """
         # decision part
-        if self.center_freq == self.freqs[-1]:
+        if self.index_of_loop == len(self.freqs) - 1:
             # these comments are left for profiling., otherwise the code would run forever
             # self.profiler_counter = self.profiler_counter + 1
             # if self.profiler_counter == 50:
             # sys.exit(1)
 
-            value_of_this_scan = max(self.measured_power_list)
-            # check if it is an update value
-            
-            if value_of_this_scan > self.threshold_gain:
-                self.found_gain = value_of_this_scan
-                self.found_frequency = self.measured_frequency_list[
-                    self.measured_power_list.index(value_of_this_scan)
-                ]
-                ## These print statements are left for debugging purposes
-                # print("Found frequency = ", self.found_frequency)
-                # print("Found Gain = ", self.found_gain)
-                # send the found frequency and gain to the UDP server
-                message = str(self.found_frequency) + "," + str(self.found_gain) + "\n"
-                self.sock.sendto(message.encode(), self.server_address)
-                
+            self.metrics.count("sweeps")
+            if self.sweep_time is not None:
+                self.metrics.observe("sweep_period", frame_time - self.sweep_time)
+            self.sweep_time = frame_time
+
+            if self.wide == True and self.panorama_file is not None:
+                self.panorama.save(self.panorama_file)
+
+            detected, coasting, lost = self.tracks.update(
+                self.peak_frequency_list, self.peak_power_list, self.peak_time_list
+            )
+            mode = WIDE if self.wide else NARROW
+            for slot in detected:
+                self.send_message(
+                    self.tracks.frequency[slot], self.tracks.power[slot], mode, self.tracks.ids[slot]
+                )
+            for slot in coasting:
+                # missed in this sweep, last detection repeated
+                self.send_message(
+                    self.tracks.frequency[slot], self.tracks.power[slot], COAST, self.tracks.ids[slot]
+                )
+            for track, frequency, power in lost:
+                # lost message with last frequency
+                self.send_message(frequency, power, LOST, track)
+                print("Lost the signal", track)
+
+            if detected.size:
+                # the strongest emitter of this sweep
+                strongest = detected[np.argmax(self.tracks.power[detected])]
+                self.found_gain = self.tracks.power[strongest]
+                self.found_frequency = self.tracks.frequency[strongest]
+                # time from the end of the detected hop until it is reported
+                self.metrics.observe("detection_latency", frame_time - self.tracks.time[strongest])
+
+            if self.tracks.active().size:
                 if self.wide == True:
                     self.wide = False
                     self.bandwidth = 18e6
                     self.change_bandwidth()
-
-                #following part of this if block is added to ensure we lost the signal (ilhami)
-                self.lost_counter = 0 # added
-
-            else:
-                # in this case this means we lost it
-                #this else code is manipulated to ensure we lost the signal. Older version is zipped. (ilhami)
-                self.lost_counter += 1
-                if self.lost_counter == 5:
-                    self.lost_counter = 0
-                    self.wide = True
-                    self.bandwidth = 54e6
-                    self.change_bandwidth()
-
-                    message = str(self.found_frequency) + ",1500\n" # lost message with last frequency
-                    self.sock.sendto(message.encode(), self.server_address)
-                else:
-                    message = str(self.found_frequency) + "," + str(self.found_gain) + "\n"
-                    self.sock.sendto(message.encode(), self.server_address)
-                    self.wide = False
-
-                    
-
-                print("Lost the signal",self.lost_counter)
+            elif self.wide == False:
+                # every track is lost
+                self.wide = True
+                self.bandwidth = 54e6
+                self.change_bandwidth()
 
             if self.wide == True:
                 self.get_frequencies()
             else:
                 self.get_frequencies_around_center()
             # reset lists
-            self.measured_frequency_list = []
-            self.measured_power_list = []
+            self.peak_frequency_list = []
+            self.peak_power_list = []
+            self.peak_time_list = []
             self.index_of_loop = 0
 
         else:
@@ -197,73 +342,182 @@ class emitter_finder:
 
     def change_center_freq(self):
         """
-        Change the center frequency of the SDR by sending a request to the Maia SDR.
+        Change the center frequency of the SDR by queueing a request to the Maia SDR,
+        together with any other pending change (e.g. the bandwidth of a mode switch).
+        The request is sent by the control client without blocking the spectrum loop.
         """
-        json = {"rx_lo_frequency": int(self.center_freq)}
-        response = requests.patch(self.http_adress + "/api/ad9361", json=json)
-        if response.status_code != 200:
-            print(response.text)
-            sys.exit(1)
-        else:
-            return True
+        changes = {"rx_lo_frequency": int(round(self.center_freq))}
+        if self.gain is not None:
+            # the ranged gain of the band goes out with the retune
+            changes["rx_gain"] = self.gain.gain(self.center_freq)
+        self.hop_gain = changes.get("rx_gain", self.rx_gain)
+        self.radio_state.set(changes)
+        return self.radio_state.flush(self.control)
+
+    def rf_bandwidth(self):
+        """
+        RF bandwidth applied to the SDR for the current mode.
+        """
+        return rf_bandwidth(self.bandwidth)
 
     def change_bandwidth(self):
         """
-        Change the bandwidth of the SDR by sending a request to the Maia SDR.
+        Change the RF bandwidth of the SDR, sent with the next change_center_freq().
         """
-        json = {"bandwidth": self.bandwidth}
-        response = requests.patch(self.http_adress + "/api/ad9361", json=json)
-        if response.status_code != 200:
-            print(response.text)
-            sys.exit(1)
-        else:
-            return True
+        return self.radio_state.set({"rx_rf_bandwidth": self.rf_bandwidth()})
 
-    def UDP_init(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address = ("localhost", 10010)
+    def send_message(self, frequency, gain, mode, track=None):
+        self.publisher.publish(frequency, gain, mode, radio=self.radio, track=track)
+        self.metrics.count("udp_sent")
+
+    def UDP_init(self, destinations=None, format="text", batch=1, max_delay=None):
+        if not destinations:
+            destinations = [("localhost", 10010)]
+        self.publisher = detection_publisher(destinations, format, batch, max_delay)
         return
 
 
-def setup_maiasdr(args):
-    response = requests.patch(
-        args.http_address + "/api/ad9361",
-        json={
-            "sampling_frequency": args.samp_rate,
-            "rx_rf_bandwidth": args.bandwidth,
-            "rx_lo_frequency": int(args.frequency_range[0]),
-            'rx_gain': args.rx_gain,
-            "rx_gain_mode": "Manual",
-        },
-    )
-    if response.status_code != 200:
-        print(response.text)
+async def setup_maiasdr(control, args, state=None, center_freq=None):
+    # sent over the keep-alive connection of the control client, no requests import needed
+    if center_freq is None:
+        center_freq = args.frequency_range[0]
+    settings = {
+        "sampling_frequency": args.samp_rate,
+        "rx_rf_bandwidth": rf_bandwidth(args.bandwidth),
+        "rx_lo_frequency": int(round(center_freq)),
+        'rx_gain': args.rx_gain,
+        "rx_gain_mode": "Manual",
+    }
+    if state is None:
+        state = radio_state()
+    # the shadow state of the finder starts from what the radio reports here
+    status_code, text = await state.configure(control, settings)
+    if status_code != 200:
+        print(text)
         sys.exit(1)
-    response = requests.patch(
-        args.http_address + "/api/spectrometer",
-        json={
+    status_code, text = await control.patch(
+        "/api/spectrometer",
+        {
             "output_sampling_frequency": args.spectrum_rate,
             "mode": "Average",
         },
     )
-    if response.status_code != 200:
-        print(response.text)
+    if status_code != 200:
+        print(text)
         sys.exit(1)
 
 
-async def spectrum_loop(address, finder):
-    async with websockets.connect(address) as ws:
-        while True:
-            spec = np.frombuffer(await ws.recv(), "float32")
-            power_arry = 10 * np.log10(spec)
-            finder.process_measurement(power_arry)
+async def receive_loop(source, finder, max_frames=None):
+    metrics = finder.metrics
+    done_time = source.clock()
+    frame_counter = 0
+    frames = source.frames()
+    try:
+        async for spec, frame_time in frames:
+            # time spent waiting for the frame vs. processing it
+            metrics.observe("recv_wait", frame_time - done_time)
+            finder.process_measurement(spec, frame_time)
+            done_time = source.clock()
+            metrics.observe("processing", done_time - frame_time)
+            metrics.count("frames_received")
+            frame_counter = frame_counter + 1
+            if frame_counter == max_frames:
+                return
+    finally:
+        await frames.aclose()
+
+
+async def spectrum_loop(
+    source, control, finder, metrics_port=None, metrics_interval=None, max_frames=None, pool=None
+):
+    # retunes are sent by the control task while the receive loop keeps reading frames
+    finder.control = control
+    finder.settle.clock = source.clock
+    control.metrics = finder.metrics
+    tasks = [asyncio.create_task(control.run())]
+    if metrics_port:
+        tasks.append(asyncio.create_task(finder.metrics.serve(metrics_port)))
+    if metrics_interval:
+        tasks.append(asyncio.create_task(finder.metrics.log_periodically(metrics_interval)))
+    if pool is None:
+        receive = asyncio.create_task(receive_loop(source, finder, max_frames))
+    else:
+        from analysis_pool import pooled_receive_loop
+
+        receive = asyncio.create_task(pooled_receive_loop(source, finder, pool, max_frames))
+    pending = {receive, *tasks}
+    try:
+        while receive in pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # a failed control or metrics task stops the finder instead of every later
+                # frame being dropped as unsettled
+                task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run(args, finder):
+    source = websocket_source(args.ws_address + "/waterfall")
+    control = maia_control(args.http_address)
+    ring = None
+    pool = None
+    try:
+        if args.ring:
+            from frame_ring import frame_ring
+
+            # viewers and the recorder read the frames from here instead of a second websocket
+            ring = frame_ring(
+                args.ring, args.ring_size, create=True, samp_rate=args.samp_rate, spectrum_rate=args.spectrum_rate
+            )
+            # tagged with the LO and gain the radio acknowledged, settle window frames are flagged
+            source = ring_tee(
+                source,
+                ring,
+                lambda: finder.radio_state.applied.get("rx_lo_frequency"),
+                finder.settle.settled,
+                lambda: finder.radio_state.applied.get("rx_gain"),
+            )
+        if args.workers > 0:
+            from analysis_pool import analysis_pool
+
+            pool = analysis_pool(
+                args.workers,
+                args.ring_slots,
+                4096,
+                args.detector,
+                args.threshold_gain,
+                args.cfar_margin,
+                args.min_separation,
+            )
+        # the first frames belong to the first hop of the sweep
+        finder.center_freq = finder.freqs[0]
+        await setup_maiasdr(control, args, finder.radio_state, finder.center_freq)
+        await spectrum_loop(
+            source,
+            control,
+            finder,
+            args.metrics_port,
+            args.metrics_interval,
+            args.max_frames,
+            pool,
+        )
+    finally:
+        if pool is not None:
+            pool.close()
+        if ring is not None:
+            ring.close()
+        # the last partial batch of detections
+        finder.publisher.close()
 
 
-def main_async(ws_address, finder):
-    asyncio.run(spectrum_loop(ws_address, finder))
+def main_async(args, finder):
+    asyncio.run(run(args, finder))
 
 
-def parse_args():
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Emitter finter over waterfall using Maia SDR"
     )
@@ -330,16 +584,212 @@ def parse_args():
         help="Threshold to decide whether the device is found or not",
         required=False,
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--settle_time",
+        type=float,
+        default=0.002,
+        help="Time after a retune acknowledgement before frames are used [default=%(default)r] s",
+        required=False,
+    )
+    parser.add_argument(
+        "--dwell_frames",
+        type=int,
+        default=2,
+        help="Number of clean frames averaged on each hop [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--panorama_file",
+        type=str,
+        default=None,
+        help="If given, the stitched spectrum is saved here (.npz) after every wide sweep, not with --workers",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_skip",
+        type=int,
+        default=4,
+        help="Quiet hops of the wide sweep are visited once every max_skip passes [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--detector",
+        type=str,
+        choices=["fixed", "cfar"],
+        default="fixed",
+        help="fixed: threshold_gain, cfar: adaptive per-bin noise floor [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--cfar_margin",
+        type=float,
+        default=12,
+        help="Detection margin above the noise floor for the cfar detector [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_tracks",
+        type=int,
+        default=8,
+        help="Emitters tracked at the same time [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--track_gate",
+        type=float,
+        default=1e6,
+        help="Largest distance of a peak from a track to be associated with it [default=%(default)r] Hz",
+        required=False,
+    )
+    parser.add_argument(
+        "--min_separation",
+        type=int,
+        default=16,
+        help="Smallest distance between two peaks of one hop [default=%(default)r] bins",
+        required=False,
+    )
+    parser.add_argument(
+        "--lookout_hops",
+        type=int,
+        default=1,
+        help="Wide hops added to each narrow sweep to find new emitters [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--gain_mode",
+        type=str,
+        choices=["manual", "auto"],
+        default="manual",
+        help="manual: rx_gain everywhere, auto: gain ranged per 20 MHz band [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--min_gain",
+        type=int,
+        default=0,
+        help="Lowest gain of the auto gain mode [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_gain",
+        type=int,
+        default=70,
+        help="Highest gain of the auto gain mode [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--gain_step",
+        type=int,
+        default=3,
+        help="Gain change of one ranging step [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--gain_ceiling",
+        type=float,
+        default=110,
+        help="Peak level above which the gain of a band is reduced [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--gain_floor",
+        type=float,
+        default=35,
+        help="Median level below which the gain of a band is raised [default=%(default)r] dB",
+        required=False,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes doing the per-hop analysis, 0 for the receive loop itself [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--ring_slots",
+        type=int,
+        default=64,
+        help="Frames of the shared memory ring feeding the workers [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--ring",
+        type=str,
+        default=None,
+        help="Name of a shared memory ring every received frame is written to, for other readers",
+        required=False,
+    )
+    parser.add_argument(
+        "--ring_size",
+        type=int,
+        default=256,
+        help="Frames kept in the shared memory ring [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=None,
+        help="Local TCP port serving a JSON metrics snapshot per connection",
+        required=False,
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=None,
+        help="Print a JSON metrics snapshot every metrics_interval s",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_frames",
+        type=int,
+        default=None,
+        help="Stop after max_frames frames (startup benchmark), run forever if not given",
+        required=False,
+    )
+    parser.add_argument(
+        "--udp_destination",
+        type=parse_destination,
+        action="append",
+        default=[],
+        help="HOST:PORT receiving the detections, can be repeated (multicast allowed) [default: localhost:10010]",
+        required=False,
+    )
+    parser.add_argument(
+        "--publish_format",
+        type=str,
+        choices=["text", "binary"],
+        default="text",
+        help="text: legacy 'frequency,gain' strings, binary: fixed-size records [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--publish_batch",
+        type=int,
+        default=1,
+        help="Binary records per datagram [default=%(default)r]",
+        required=False,
+    )
+    parser.add_argument(
+        "--publish_max_delay",
+        type=float,
+        default=None,
+        help="Send a partial batch once its oldest record is this old [s]",
+        required=False,
+    )
+    return parser
 
 
-def main():
-    args = parse_args()
+def parse_args():
+    return build_parser().parse_args()
 
-    setup_maiasdr(args)
-    waterfall_address = args.ws_address + "/waterfall"
 
-    emitter = emitter_finder(
+def finder_from_args(args):
+    if args.panorama_file is not None and args.workers > 0:
+        # the spectra stay in the workers, the panorama would never be filled
+        print("--panorama_file cannot be used with --workers")
+        sys.exit(1)
+    return emitter_finder(
         args.center_freq,
         args.rx_gain,
         args.bandwidth,
@@ -349,11 +799,35 @@ def main():
         args.http_address,
         args.frequency_range,
         args.threshold_gain,
+        args.settle_time,
+        args.dwell_frames,
+        args.panorama_file,
+        args.max_skip,
+        args.detector,
+        args.cfar_margin,
+        args.max_tracks,
+        args.track_gate,
+        args.min_separation,
+        args.lookout_hops,
+        args.gain_mode,
+        (args.min_gain, args.max_gain),
+        args.gain_step,
+        args.gain_ceiling,
+        args.gain_floor,
     )
+
+
+def main():
+    args = parse_args()
+
+    emitter = finder_from_args(args)
     emitter.get_frequencies()
-    emitter.UDP_init()
+    emitter.UDP_init(
+        args.udp_destination, args.publish_format, args.publish_batch, args.publish_max_delay
+    )
 
-    loop = threading.Thread(target=main_async, args=(waterfall_address, emitter))
+    # the radio is set up on the event loop thread, over the control client connection
+    loop = threading.Thread(target=main_async, args=(args, emitter))
     loop.start()
 
 
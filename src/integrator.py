@@ -0,0 +1,96 @@
+"""
+Streaming integration of waterfall frames.
+-------------------
+Reduces blocks of `integrations` frames to one spectrum as the frames arrive, in float32 and
+in buffers allocated once, so recording at the full spectrum rate needs the memory of one
+block at most:
+
+    mean          running sum, divided once per block
+    max           max hold
+    percentile    the frames of the block are kept in a preallocated (integrations, bins)
+                  array and the nearest-rank percentile of each bin is taken at the end
+
+integrations is the decimation in time. With bin_decimation > 1 every bin_decimation adjacent
+bins are reduced to one, by their mean (mean, percentile) or their max (max).
+"""
+
+import numpy as np
+
+REDUCERS = ("mean", "max", "percentile")
+
+
+class integrator:
+    def __init__(self, n_bins, integrations, reducer="mean", percentile=90, bin_decimation=1):
+        if reducer not in REDUCERS:
+            raise ValueError("unknown reducer " + repr(reducer))
+        if n_bins % bin_decimation != 0:
+            raise ValueError("bin_decimation must divide the number of bins")
+        self.integrations = integrations
+        self.reducer = reducer
+        self.percentile = percentile
+        self.bin_decimation = bin_decimation
+
+        self.out = np.zeros(n_bins // bin_decimation, dtype=np.float32)
+        if reducer == "percentile":
+            self.block = np.zeros((integrations, self.out.size), dtype=np.float32)
+        else:
+            self.accumulator = np.zeros(n_bins, dtype=np.float32)
+        self.count = 0  # frames in the current block
+        self.start_ns = None  # time of the first and the last frame of the block
+        self.stop_ns = None
+
+        self.frames = 0
+        self.spectra = 0
+
+    def add(self, spec, time_ns):
+        """
+        Add one frame. Returns the reduced spectrum (a view of a buffer that is reused by the
+        next block) when the block is complete, None otherwise.
+        """
+        if self.count == 0:
+            self.start_ns = time_ns
+        self.stop_ns = time_ns
+        if self.reducer == "percentile":
+            row = self.block[self.count]
+            if self.bin_decimation > 1:
+                np.mean(spec.reshape(-1, self.bin_decimation), axis=1, out=row)
+            else:
+                np.copyto(row, spec)
+        elif self.count == 0:
+            np.copyto(self.accumulator, spec)
+        elif self.reducer == "mean":
+            np.add(self.accumulator, spec, out=self.accumulator)
+        else:
+            np.maximum(self.accumulator, spec, out=self.accumulator)
+        self.count = self.count + 1
+        self.frames = self.frames + 1
+        if self.count == self.integrations:
+            return self.reduce()
+        return None
+
+    def reduce(self):
+        """
+        Reduce the frames added since the last block, e.g. a partial block before the LO
+        changes. Returns None if there are none.
+        """
+        if self.count == 0:
+            return None
+        if self.reducer == "percentile":
+            block = self.block[: self.count]
+            rank = int(round((self.count - 1) * self.percentile / 100))
+            block.partition(rank, axis=0)
+            np.copyto(self.out, block[rank])
+        else:
+            if self.bin_decimation > 1:
+                groups = self.accumulator.reshape(-1, self.bin_decimation)
+                if self.reducer == "mean":
+                    np.sum(groups, axis=1, out=self.out)
+                else:
+                    np.max(groups, axis=1, out=self.out)
+            else:
+                np.copyto(self.out, self.accumulator)
+            if self.reducer == "mean":
+                self.out *= np.float32(1 / (self.count * self.bin_decimation))
+        self.count = 0
+        self.spectra = self.spectra + 1
+        return self.out
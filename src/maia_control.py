@@ -0,0 +1,142 @@
+"""
+Asynchronous control client for the Maia SDR HTTP API.
+-------------------
+The waterfall is processed on the asyncio event loop, therefore the radio parameters
+(LO, bandwidth, ...) are changed through a single persistent keep-alive connection
+instead of a blocking requests.patch call per hop.
+
+Requests are queued with submit() and sent in order by run(), so the receive loop never
+waits for the radio to acknowledge a retune.
+"""
+
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+def patch_blocking(http_address, path, payload):
+    """
+    Blocking PATCH for code outside the event loop. Returns (status_code, text).
+    """
+    # only the blocking path needs http.client, the event loop path does not import it
+    import http.client
+
+    url = urlsplit(http_address)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+    try:
+        connection.request(
+            "PATCH", path, json.dumps(payload), {"Content-Type": "application/json"}
+        )
+        response = connection.getresponse()
+        return response.status, response.read().decode()
+    finally:
+        connection.close()
+
+
+class maia_control:
+    def __init__(self, http_address):
+        url = urlsplit(http_address)
+        self.host = url.hostname
+        self.port = url.port or 80
+
+        self.reader = None
+        self.writer = None
+        self.queue = asyncio.Queue()
+        self.request_counter = 0  # number of acknowledged requests
+        self.metrics = None  # metrics, records the round-trip time of the requests
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def patch(self, path, payload):
+        """
+        Send a PATCH request and wait for its response. Returns (status_code, text).
+        """
+        body = json.dumps(payload).encode()
+        request = (
+            "PATCH " + path + " HTTP/1.1\r\n"
+            "Host: " + self.host + ":" + str(self.port) + "\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: " + str(len(body)) + "\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n"
+        ).encode() + body
+
+        # the server may drop an idle keep-alive connection, so retry once on a new one
+        for attempt in range(2):
+            if self.writer is None:
+                await self.connect()
+            try:
+                self.writer.write(request)
+                await self.writer.drain()
+                status_code, text = await self.read_response()
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt == 1:
+                    raise
+
+        self.request_counter = self.request_counter + 1
+        return status_code, text
+
+    async def read_response(self):
+        status_line = await self.reader.readuntil(b"\r\n")
+        status_code = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                body = body + chunk[:-2]
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+
+        return status_code, body.decode()
+
+    def submit(self, path, payload, on_done=None):
+        """
+        Queue a PATCH request without waiting for it. Must be called from the event loop thread.
+        on_done(text) is called with the response once the radio acknowledges the request.
+        """
+        self.queue.put_nowait((path, payload, on_done))
+
+    async def run(self):
+        """
+        Send the queued requests in order over the persistent connection.
+        """
+        while True:
+            path, payload, on_done = await self.queue.get()
+            start = time.monotonic()
+            status_code, text = await self.patch(path, payload)
+            if self.metrics is not None:
+                self.metrics.observe("retune_rtt", time.monotonic() - start)
+            if status_code != 200:
+                print(text)
+                raise SystemExit(1)
+            if on_done is not None:
+                on_done(text)
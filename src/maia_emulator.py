@@ -0,0 +1,230 @@
+"""
+Local stand-in for the Maia SDR server, for load and latency benchmarking.
+-------------------
+Serves on one port, like the radio:
+    PATCH /api/ad9361       rx_lo_frequency, sampling_frequency, rx_rf_bandwidth, rx_gain, ...
+                            answered after --retune_latency, the new LO is used from then on
+    PATCH /api/spectrometer output_sampling_frequency sets the waterfall frame rate
+    GET   /waterfall        websocket stream of 4096 float32 linear power bins
+
+The waterfall holds exponential noise at --floor_db and the synthetic emitters given with
+--emitter FREQ:DB that fall inside the sampled band. Both levels are at rx_gain 60 dB and move
+with rx_gain dB for dB; bins are clipped at --clip_db, like a saturated ADC. Frames that cannot be sent in time
+(slow client, full socket buffer) are counted as dropped and printed on disconnect.
+
+Only the standard library is used. Point initial_code.py at it with
+    --ws_address ws://127.0.0.1:8000 --http_address http://127.0.0.1:8000
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+
+import numpy as np
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+N_BINS = 4096
+REFERENCE_GAIN = 60  # dB, rx_gain of the --floor_db and --emitter levels
+
+
+class maia_emulator:
+    def __init__(self, retune_latency, floor_db, emitters, max_buffer=1 << 20, clip_db=120):
+        self.retune_latency = retune_latency  # s
+        self.floor = 10 ** (floor_db / 10)
+        self.clip = np.float32(10 ** (clip_db / 10))
+        self.emitters = emitters  # [(frequency, power in dB)]
+        self.max_buffer = max_buffer  # bytes queued in a socket before frames are dropped
+
+        self.ad9361 = {
+            "sampling_frequency": 54000000,
+            "rx_rf_bandwidth": 18000000,
+            "rx_lo_frequency": 2800000000,
+            "rx_gain": 60,
+            "rx_gain_mode": "Manual",
+        }
+        self.spectrometer = {"output_sampling_frequency": 160.0, "mode": "Average"}
+        self.rng = np.random.default_rng()
+
+        self.retune_counter = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def make_frame(self):
+        samp_rate = self.ad9361["sampling_frequency"]
+        lo = self.ad9361["rx_lo_frequency"]
+        frame = self.rng.exponential(self.floor, N_BINS).astype(np.float32)
+        for frequency, power in self.emitters:
+            index = int(round((frequency - lo) / samp_rate * N_BINS + N_BINS / 2))
+            if 0 <= index < N_BINS:
+                frame[index] = frame[index] + 10 ** (power / 10)
+        if self.ad9361["rx_gain"] != REFERENCE_GAIN:
+            frame *= np.float32(10 ** ((self.ad9361["rx_gain"] - REFERENCE_GAIN) / 10))
+        return np.minimum(frame, self.clip, out=frame)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readuntil(b"\r\n")
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readuntil(b"\r\n")
+                    if line == b"\r\n":
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if method == "GET" and path == "/waterfall" and "sec-websocket-key" in headers:
+                    await self.waterfall(reader, writer, headers["sec-websocket-key"])
+                    return
+                elif method == "PATCH" and path == "/api/ad9361":
+                    self.ad9361.update(json.loads(body))
+                    await asyncio.sleep(self.retune_latency)
+                    self.retune_counter = self.retune_counter + 1
+                    self.respond(writer, 200, self.ad9361)
+                elif method == "PATCH" and path == "/api/spectrometer":
+                    self.spectrometer.update(json.loads(body))
+                    self.respond(writer, 200, self.spectrometer)
+                elif method == "GET" and path in ("/api/ad9361", "/api/spectrometer"):
+                    self.respond(writer, 200, self.ad9361 if path == "/api/ad9361" else self.spectrometer)
+                else:
+                    self.respond(writer, 404, {"error": "not found"})
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status_code, payload):
+        body = json.dumps(payload).encode()
+        writer.write(
+            (
+                "HTTP/1.1 " + str(status_code) + (" OK" if status_code == 200 else " Not Found") + "\r\n"
+                "Content-Type: application/json\r\n"
+                "Content-Length: " + str(len(body)) + "\r\n"
+                "\r\n"
+            ).encode()
+            + body
+        )
+
+    async def waterfall(self, reader, writer, key):
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                "Sec-WebSocket-Accept: " + accept + "\r\n"
+                "\r\n"
+            ).encode()
+        )
+        await writer.drain()
+
+        control = asyncio.create_task(self.websocket_control(reader, writer))
+        header = b"\x82\x7e" + struct.pack(">H", N_BINS * 4)  # binary frame, 16 bit length
+        sent = 0
+        dropped = 0
+        next_time = time.perf_counter()
+        try:
+            while not control.done():
+                next_time = next_time + 1 / self.spectrometer["output_sampling_frequency"]
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                if writer.transport.get_write_buffer_size() > self.max_buffer:
+                    dropped = dropped + 1  # client is not reading fast enough
+                    await asyncio.sleep(0)
+                    continue
+                writer.write(header + self.make_frame().tobytes())
+                sent = sent + 1
+        except ConnectionError:
+            pass
+        finally:
+            control.cancel()
+            self.frames_sent = self.frames_sent + sent
+            self.frames_dropped = self.frames_dropped + dropped
+            print("waterfall closed: sent", sent, "dropped", dropped, "retunes", self.retune_counter)
+
+    async def websocket_control(self, reader, writer):
+        """
+        Answer pings and close frames of the (masked) client frames.
+        """
+        try:
+            while True:
+                first, second = await reader.readexactly(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    (length,) = struct.unpack(">H", await reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack(">Q", await reader.readexactly(8))
+                mask = await reader.readexactly(4) if second & 0x80 else b"\x00\x00\x00\x00"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+
+                if opcode == 0x9:  # ping -> pong
+                    writer.write(bytes([0x8A, len(payload)]) + payload)
+                elif opcode == 0x8:  # close
+                    writer.write(bytes([0x88, len(payload)]) + payload)
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+
+def parse_emitter(text):
+    frequency, power = text.split(":")
+    return float(frequency), float(power)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local Maia SDR emulator")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="listen address [default=%(default)r]")
+    parser.add_argument("--port", type=int, default=8000, help="listen port [default=%(default)r]")
+    parser.add_argument(
+        "--retune_latency",
+        type=float,
+        default=0.0005,
+        help="Time to answer a /api/ad9361 PATCH [default=%(default)r] s",
+    )
+    parser.add_argument(
+        "--floor_db",
+        type=float,
+        default=40,
+        help="Noise floor of the waterfall [default=%(default)r] dB",
+    )
+    parser.add_argument(
+        "--clip_db",
+        type=float,
+        default=120,
+        help="Level at which the bins saturate [default=%(default)r] dB",
+    )
+    parser.add_argument(
+        "--emitter",
+        type=parse_emitter,
+        action="append",
+        default=[],
+        help="Synthetic emitter FREQ:DB, can be repeated, e.g. 3.7e9:95",
+    )
+    return parser.parse_args()
+
+
+async def serve(args):
+    emulator = maia_emulator(args.retune_latency, args.floor_db, args.emitter, clip_db=args.clip_db)
+    server = await asyncio.start_server(emulator.handle, args.host, args.port)
+    print("Maia SDR emulator on http://%s:%d" % (args.host, args.port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    args = parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
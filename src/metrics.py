@@ -0,0 +1,96 @@
+"""
+Low overhead counters and histograms for the running finder.
+-------------------
+Counters are plain integers, histograms count durations in power-of-two microsecond buckets,
+so recording a value is a few hundred nanoseconds. A snapshot is exposed as JSON
+ - periodically on stdout (one line per interval), and/or
+ - on a local read-only TCP socket: every connection receives one snapshot and is closed,
+   e.g. `nc 127.0.0.1 10020`.
+"""
+
+import asyncio
+import json
+import math
+import time
+
+N_BUCKETS = 32  # bucket b counts durations in [2**(b-1), 2**b) us
+
+
+class histogram:
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.0  # s
+        self.maximum = 0.0  # s
+
+    def observe(self, seconds):
+        bucket = math.frexp(seconds * 1e6)[1]
+        self.buckets[min(max(bucket, 0), N_BUCKETS - 1)] += 1
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile, in s.
+        """
+        target = self.count * q / 100
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen = seen + count
+            if count and seen >= target:
+                return 2.0**bucket / 1e6
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.maximum * 1e3,
+        }
+
+
+class metrics:
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.counters = {}
+        self.histograms = {}
+        self.sources = []  # callables returning extra counters, e.g. the settle tracker
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = histogram()
+        hist.observe(seconds)
+
+    def snapshot(self):
+        counters = dict(self.counters)
+        for source in self.sources:
+            counters.update(source())
+        return {
+            "time": time.time(),
+            "uptime": time.monotonic() - self.start_time,
+            "counters": counters,
+            "histograms": {name: hist.summary() for name, hist in self.histograms.items()},
+        }
+
+    async def log_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(json.dumps(self.snapshot()), flush=True)
+
+    async def serve(self, port, host="127.0.0.1"):
+        async def send_snapshot(reader, writer):
+            writer.write(json.dumps(self.snapshot()).encode() + b"\n")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(send_snapshot, host, port)
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,136 @@
+"""
+Multi-radio orchestration.
+-------------------
+Drives several Pluto/Maia SDR units from one process and one asyncio loop. Every radio has
+its own emitter_finder, websocket source and control client; all finders publish into one
+shared detection_publisher, so the detections of all radios come out as a single stream,
+time stamped on the same clock and tagged with the radio index (binary format, the default
+here). --workers, --ring, --metrics_port and --panorama_file are single radio options.
+
+    --split partition   frequency_range is cut into one contiguous sub-range per radio, so a
+                        full sweep takes roughly 1/N of the time
+    --split same        every radio sweeps the whole range (e.g. direction finding)
+
+Usage:
+    python src/multi_radio.py --radio ws://192.168.2.1:8000,http://192.168.2.1:8000 \\
+                              --radio ws://192.168.3.1:8000,http://192.168.3.1:8000
+"""
+
+import asyncio
+import copy
+
+from detection_publisher import detection_publisher
+from initial_code import build_parser, finder_from_args, setup_maiasdr, spectrum_loop
+from maia_control import maia_control
+from spectrum_source import websocket_source
+
+
+def parse_radio(text):
+    ws_address, http_address = text.split(",")
+    return ws_address, http_address
+
+
+def split_range(frequency_range, n_radios, split, overlap=0):
+    """
+    Sub-range of every radio. The partitions reach overlap Hz into the next one, so the
+    boundary between two partitions is swept by both radios.
+    """
+    if split == "same":
+        return [list(frequency_range)] * n_radios
+    width = (frequency_range[1] - frequency_range[0]) / n_radios
+    return [
+        [
+            frequency_range[0] + i * width,
+            min(frequency_range[0] + (i + 1) * width + overlap, frequency_range[1]),
+        ]
+        for i in range(n_radios)
+    ]
+
+
+def radio_args(args, ws_address, http_address, frequency_range):
+    radio = copy.copy(args)
+    radio.ws_address = ws_address
+    radio.http_address = http_address
+    radio.frequency_range = frequency_range
+    radio.panorama_file = None
+    return radio
+
+
+async def run(args):
+    publisher = detection_publisher(
+        args.udp_destination or [("localhost", 10010)],
+        args.publish_format,
+        args.publish_batch,
+        args.publish_max_delay,
+    )
+    # at least one hop of every mode
+    overlap = max(args.bandwidth, args.samp_rate)
+    ranges = split_range(args.frequency_range, len(args.radio), args.split, overlap)
+
+    radios = []
+    for index, ((ws_address, http_address), frequency_range) in enumerate(zip(args.radio, ranges)):
+        radio = radio_args(args, ws_address, http_address, frequency_range)
+        finder = finder_from_args(radio)
+        finder.radio = index
+        finder.publisher = publisher
+        finder.get_frequencies()
+        finder.center_freq = finder.freqs[0]
+        source = websocket_source(ws_address + "/waterfall")
+        control = maia_control(http_address)
+        radios.append((radio, finder, source, control))
+
+    with publisher:
+        await asyncio.gather(
+            *(
+                setup_maiasdr(control, radio, finder.radio_state, finder.center_freq)
+                for radio, finder, _, control in radios
+            )
+        )
+        await asyncio.gather(
+            *(
+                spectrum_loop(source, control, finder, max_frames=args.max_frames)
+                for _, finder, source, control in radios
+            )
+        )
+
+
+def parse_args():
+    parser = build_parser()
+    parser.description = "Emitter finder over several Maia SDR units"
+    parser.add_argument(
+        "--radio",
+        type=parse_radio,
+        action="append",
+        required=True,
+        help="WS_ADDRESS,HTTP_ADDRESS of one radio, repeat for every radio",
+    )
+    parser.add_argument(
+        "--split",
+        type=str,
+        choices=["partition", "same"],
+        default="partition",
+        help="partition: one sub-range per radio, same: every radio sweeps the whole range [default=%(default)r]",
+    )
+    # the text format has no radio index, the merged stream could not be told apart
+    parser.set_defaults(publish_format="binary")
+    args = parser.parse_args()
+    for option, value in (
+        ("--workers", args.workers > 0),
+        ("--ring", args.ring is not None),
+        ("--metrics_port", args.metrics_port is not None),
+        ("--panorama_file", args.panorama_file is not None),
+    ):
+        if value:
+            parser.error(option + " is not supported in multi-radio mode")
+    if len(args.radio) > 1 and args.publish_format == "text":
+        parser.error("--publish_format text drops the radio index, use binary with several radios")
+    return args
+
+
+def main():
+    args = parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
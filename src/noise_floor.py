@@ -0,0 +1,131 @@
+"""
+Streaming per-hop, per-bin noise floor for CFAR style detection.
+-------------------
+For every LO a row of a fixed float32 table holds a running quantile (the median by default)
+of the linear power of each bin. The quantile is tracked with multiplicative steps: up by
+step_db * quantile when the bin is above its floor, down by step_db * (1 - quantile)
+otherwise. Bins above the detection threshold do not raise the floor, so a steady emitter
+is not absorbed into it. The threshold of a bin is its floor plus margin dB.
+
+LOs within key_step of each other share a row, so the narrow plans that follow an emitter
+reuse the floor of the previous sweep. The table keeps max_hops rows, the least recently used
+one is replaced when it is full.
+"""
+
+import collections
+
+import numpy as np
+
+
+class noise_floor:
+    def __init__(
+        self, n_bins=4096, max_hops=128, quantile=0.5, step_db=0.5, margin=12, warmup=8, key_step=1e6
+    ):
+        self.key_step = key_step  # Hz, LOs closer than this share a row
+        self.floor = np.zeros((max_hops, n_bins), dtype=np.float32)
+        self.updates = np.zeros(max_hops, dtype=np.int64)
+        self.rows = collections.OrderedDict()  # LO -> row of the table, in LRU order
+        self.gains = {}  # LO -> gain the floor of its row was measured at
+        self.free_rows = list(range(max_hops - 1, -1, -1))
+
+        self.up = np.float32(10 ** (step_db * quantile / 10))
+        self.down = np.float32(10 ** (-step_db * (1 - quantile) / 10))
+        self.margin = margin  # dB above the floor
+        self.margin_factor = np.float32(10 ** (margin / 10))
+        self.warmup = warmup  # updates before a row is used for detection
+
+        # scratch buffers so that update() does not allocate
+        self.scratch = np.empty(n_bins, dtype=np.float32)
+        self.threshold = np.empty(n_bins, dtype=np.float32)
+        self.mask = np.empty(n_bins, dtype=bool)
+        self.below = np.empty(n_bins, dtype=bool)
+        self.above = np.empty(n_bins, dtype=bool)
+
+    def key(self, center_freq):
+        return int(round(center_freq / self.key_step))
+
+    def row(self, center_freq):
+        key = self.key(center_freq)
+        row = self.rows.get(key)
+        if row is not None:
+            self.rows.move_to_end(key)
+            return row
+
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            _, row = self.rows.popitem(last=False)
+        self.rows[key] = row
+        self.updates[row] = 0
+        return row
+
+    def reset(self, center_freq=None):
+        """
+        Forget the floor of one LO, or of all of them (e.g. after a gain change).
+        """
+        if center_freq is None:
+            self.free_rows.extend(self.rows.values())
+            self.rows.clear()
+        else:
+            self.forget(self.key(center_freq))
+
+    def forget(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.free_rows.append(row)
+
+    def set_gain(self, center_freq, gain):
+        """
+        Forget the floor of the LO if it was measured at another gain.
+        """
+        key = self.key(center_freq)
+        if self.gains.get(key, gain) != gain:
+            self.forget(key)
+        self.gains[key] = gain
+
+    def thresholds(self, center_freq):
+        """
+        Return the per-bin detection threshold (linear power) of the LO, None while its floor
+        is warming up. The array is a scratch buffer, valid until the next update().
+        """
+        row = self.rows.get(self.key(center_freq))
+        if row is None or self.updates[row] < self.warmup:
+            return None
+        return np.multiply(self.floor[row], self.margin_factor, out=self.threshold)
+
+    def peak_excess(self, center_freq, spec, scale):
+        """
+        Return (bin index, dB above the threshold) of the bin that exceeds its threshold the
+        most, None while the floor of the LO is warming up.
+        """
+        if self.thresholds(center_freq) is None:
+            return None
+
+        ratio = self.scratch
+        np.multiply(spec, scale, out=ratio)
+        np.divide(ratio, self.threshold, out=ratio)
+        index = int(np.argmax(ratio))
+        return index, 10 * np.log10(max(ratio[index], 1e-30))
+
+    def update(self, center_freq, spec, scale):
+        """
+        Update the floor of the LO with one averaged hop, spec * scale in linear power.
+        """
+        row = self.row(center_freq)
+        floor = self.floor[row]
+        power = self.scratch
+        np.multiply(spec, scale, out=power)
+
+        if self.updates[row] == 0:
+            # start flat at the median of the hop, so emitters present now are not the floor
+            floor.fill(np.median(power))
+        else:
+            # power <= floor: step down
+            np.less_equal(power, floor, out=self.below)
+            # floor < power < floor + margin: step up
+            np.multiply(floor, self.margin_factor, out=self.threshold)
+            np.less(power, self.threshold, out=self.above)
+            np.logical_and(self.above, np.logical_not(self.below, out=self.mask), out=self.above)
+            np.multiply(floor, self.down, out=floor, where=self.below)
+            np.multiply(floor, self.up, out=floor, where=self.above)
+        self.updates[row] = self.updates[row] + 1
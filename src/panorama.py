@@ -0,0 +1,94 @@
+"""
+Stitched wideband spectrum over the whole frequency range.
+-------------------
+Every hop writes its averaged bins into their slot of one preallocated float32 array at the
+waterfall bin resolution, so the last state of the whole band is always available without
+re-sweeping. Overlapping hop edges are cross-faded with a linear ramp over the overlap.
+Values are linear power; power_db() and save() give dB for the analysis notebooks.
+"""
+
+import functools
+import math
+
+import numpy as np
+
+from spectrum_engine import bin_offsets
+
+
+@functools.lru_cache(maxsize=8)
+def edge_ramp(length, overlap_bins):
+    """
+    Blend weights of one hop: 1 in the middle, linear ramps over the overlapping edges.
+    """
+    weights = np.ones(length, dtype=np.float32)
+    ramp_length = min(overlap_bins, length // 2)
+    if ramp_length > 0:
+        ramp = (np.arange(ramp_length, dtype=np.float32) + 0.5) / ramp_length
+        weights[:ramp_length] = ramp
+        weights[length - ramp_length :] = ramp[::-1]
+    weights.flags.writeable = False
+    return weights
+
+
+class panorama:
+    def __init__(self, frequency_range, samp_rate, n_bins=4096):
+        self.lower_limit = frequency_range[0]
+        self.samp_rate = samp_rate
+        self.n_bins = n_bins
+        self.resolution = samp_rate / n_bins  # Hz per bin
+
+        size = int(math.ceil((frequency_range[1] - frequency_range[0]) / self.resolution))
+        self.power = np.zeros(size, dtype=np.float32)
+        self.filled = np.zeros(size, dtype=bool)
+        self.frequencies = self.lower_limit + np.arange(size) * self.resolution
+
+        # scratch buffers so that update() does not allocate
+        self.scratch = np.empty(n_bins, dtype=np.float32)
+        self.scratch_mask = np.empty(n_bins, dtype=bool)
+
+    def update(self, center_freq, spec, scale, span, step):
+        """
+        Write one hop into the panorama.
+        spec * scale is the linear power of the hop, span is the usable width around the LO
+        (RF bandwidth) and step is the distance to the neighbouring hops.
+        """
+        offsets = bin_offsets(self.samp_rate, self.n_bins)
+        half_span = min(span, self.samp_rate) / 2
+        first = int(np.searchsorted(offsets, -half_span))
+        last = int(np.searchsorted(offsets, half_span))
+
+        # position of the first used bin in the panorama, clipped to the range
+        start = int(round((center_freq + offsets[first] - self.lower_limit) / self.resolution))
+        if start < 0:
+            first = first - start
+            start = 0
+        stop = min(start + last - first, self.power.size)
+        last = first + stop - start
+        if last <= first:
+            return
+
+        length = last - first
+        overlap_bins = int(max(span - step, 0) / self.resolution)
+        weights = edge_ramp(last - first, overlap_bins)
+
+        new = self.scratch[:length]
+        unfilled = self.scratch_mask[:length]
+        destination = self.power[start:stop]
+        np.multiply(spec[first:last], scale, out=new)
+        np.logical_not(self.filled[start:stop], out=unfilled)
+        np.copyto(destination, new, where=unfilled)
+
+        # destination += weights * (new - destination)
+        np.subtract(new, destination, out=new)
+        np.multiply(new, weights, out=new)
+        np.add(destination, new, out=destination)
+        self.filled[start:stop] = True
+
+    def power_db(self):
+        return 10 * np.log10(np.maximum(self.power, 1e-30))
+
+    def save(self, filename):
+        """
+        Save (frequencies, power in dB) in the same layout as the notebooks/data scans.
+        """
+        np.savez(filename, self.frequencies, self.power_db().astype(np.float32))
@@ -0,0 +1,112 @@
+"""
+Shadow state of the AD9361 settings of the Maia SDR.
+-------------------
+The finder does not send /api/ad9361 requests itself. It sets the values it wants with
+set(), and flush() sends every change pending since the previous flush as one PATCH, so a
+mode switch (RF bandwidth + LO) is a single round trip. Values equal to the applied or
+in-flight value are dropped without a request.
+
+The radio answers a PATCH with its resulting settings. They are compared with the request:
+numbers within the tolerance of their key (the LO is quantized to 2.4 Hz) count as applied,
+otherwise the mismatch is counted and the value reported by the radio is kept as applied.
+"""
+
+import json
+
+# largest difference between a requested and a reported value that is not a mismatch
+TOLERANCE = {"rx_lo_frequency": 3, "sampling_frequency": 1, "rx_rf_bandwidth": 1}
+
+
+class radio_state:
+    def __init__(self, path="/api/ad9361", on_request=None, on_acknowledged=None):
+        self.path = path
+        self.on_request = on_request  # called when a PATCH is queued, e.g. settle tracking
+        self.on_acknowledged = on_acknowledged  # called when the radio acknowledges it
+
+        self.applied = {}  # acknowledged by the radio
+        self.sent = {}  # queued or in flight
+        self.pending = {}  # set but not sent yet
+
+        self.requests = 0
+        self.dropped = 0  # set() calls that changed nothing
+        self.merged = 0  # set() calls sent together with an earlier one
+        self.mismatches = 0
+
+    def current(self, key):
+        for state in (self.pending, self.sent, self.applied):
+            if key in state:
+                return state[key]
+        return None
+
+    def set(self, changes):
+        """
+        Queue changes for the next flush(). Returns False if every value is already set.
+        """
+        changes = {key: value for key, value in changes.items() if self.current(key) != value}
+        if not changes:
+            self.dropped = self.dropped + 1
+            return False
+        if self.pending:
+            self.merged = self.merged + 1
+        self.pending.update(changes)
+        return True
+
+    def flush(self, control):
+        """
+        Send the pending changes as one request. Returns False if nothing was pending.
+        """
+        if not self.pending:
+            return False
+        payload = self.pending
+        self.pending = {}
+        self.sent.update(payload)
+        self.requests = self.requests + 1
+        if self.on_request is not None:
+            self.on_request()
+        control.submit(self.path, payload, lambda text: self.acknowledged(payload, text))
+        return True
+
+    async def configure(self, control, settings):
+        """
+        Send settings at once and wait for the radio, e.g. at startup. Returns (status_code, text).
+        """
+        status_code, text = await control.patch(self.path, settings)
+        if status_code == 200:
+            self.verify(settings, text)
+        return status_code, text
+
+    def acknowledged(self, payload, text):
+        for key, value in payload.items():
+            if self.sent.get(key) == value:
+                del self.sent[key]
+        self.verify(payload, text)
+        if self.on_acknowledged is not None:
+            self.on_acknowledged()
+
+    def verify(self, payload, text):
+        try:
+            reported = json.loads(text) if text else {}
+        except ValueError:
+            reported = {}
+        if not isinstance(reported, dict):
+            reported = {}
+        for key, value in payload.items():
+            actual = reported.get(key, value)
+            if actual != value and not (
+                isinstance(value, (int, float))
+                and isinstance(actual, (int, float))
+                and abs(actual - value) <= TOLERANCE.get(key, 0)
+            ):
+                self.mismatches = self.mismatches + 1
+                print("radio reports", key, "=", actual, "instead of", value)
+                self.applied[key] = actual
+            else:
+                self.applied[key] = value
+
+    def counters(self):
+        return {
+            "radio_requests": self.requests,
+            "radio_dropped": self.dropped,
+            "radio_merged": self.merged,
+            "radio_mismatches": self.mismatches,
+        }
@@ -0,0 +1,84 @@
+"""
+Offline replay of recorded waterfalls through emitter_finder.
+-------------------
+Feeds a capture (.maiacap, see capture.py) or a notebooks/data scan (.npz) into the same
+processing pipeline as initial_code.py, with a fake /api/ad9361 that switches the recorded LO.
+Runs as fast as the CPU allows unless --rate is given, and reports the throughput.
+
+Usage: python src/replay.py notebooks/data/emitter_active_10dB_scan.npz --max_frames 20000
+"""
+
+import asyncio
+import time
+
+from initial_code import build_parser, finder_from_args, spectrum_loop
+from spectrum_source import replay_control, replay_source
+
+
+def parse_args():
+    parser = build_parser()
+    parser.description = "Replay a recorded waterfall through the emitter finder"
+    # --max_frames: all records of a capture and 10000 frames of a scan if not given
+    parser.add_argument("filename", type=str, help="capture (.maiacap) or scan (.npz) file")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Replay rate in frames/s, as fast as possible if not given",
+    )
+    parser.add_argument(
+        "--retune_latency",
+        type=float,
+        default=0.0,
+        help="Emulated retune acknowledgement latency [default=%(default)r] s",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.max_frames is None and args.filename.endswith(".npz"):
+        args.max_frames = 10000
+
+    source = replay_source(args.filename, args.spectrum_rate, rate=args.rate, max_frames=args.max_frames)
+    control = replay_control(source, args.retune_latency)
+    emitter = finder_from_args(args)
+    emitter.get_frequencies()
+    emitter.UDP_init(
+        args.udp_destination, args.publish_format, args.publish_batch, args.publish_max_delay
+    )
+    emitter.control = control
+    emitter.center_freq = emitter.freqs[0]
+    emitter.change_center_freq()
+
+    pool = None
+    if args.workers > 0:
+        from analysis_pool import analysis_pool
+
+        pool = analysis_pool(
+            args.workers,
+            args.ring_slots,
+            4096,
+            args.detector,
+            args.threshold_gain,
+            args.cfar_margin,
+            args.min_separation,
+        )
+    start = time.perf_counter()
+    try:
+        asyncio.run(spectrum_loop(source, control, emitter, pool=pool))
+    finally:
+        if pool is not None:
+            pool.close()
+        emitter.publisher.close()
+    elapsed = time.perf_counter() - start
+
+    print("frames          :", source.frame_counter)
+    print("frames/s        : %.1f" % (source.frame_counter / elapsed))
+    print("clean / dropped :", emitter.settle.clean_frames, "/", emitter.settle.dropped_frames)
+    print("retunes         :", control.request_counter)
+    print("found frequency :", emitter.found_frequency, "gain:", emitter.found_gain)
+
+
+if __name__ == "__main__":
+    main()
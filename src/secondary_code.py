@@ -36,12 +36,12 @@ import asyncio
 import threading
 
 import numpy as np
-import websockets
-import requests
 
 import socket
 import sys
 
+from maia_control import patch_blocking
+
 
 class emitter_finder:
     def __init__(
@@ -157,9 +157,9 @@ class emitter_finder:
         Change the center frequency of the SDR by sending a request to the Maia SDR.
         """
         json = {"rx_lo_frequency": int(self.center_freq)}
-        response = requests.patch(self.http_adress + "/api/ad9361", json=json)
-        if response.status_code != 200:
-            print(response.text)
+        status_code, text = patch_blocking(self.http_adress, "/api/ad9361", json)
+        if status_code != 200:
+            print(text)
             sys.exit(1)
         else:
             return True
@@ -169,9 +169,9 @@ class emitter_finder:
         Change the bandwidth of the SDR by sending a request to the Maia SDR.
         """
         json = {"bandwidth": self.bandwidth}
-        response = requests.patch(self.http_adress + "/api/ad9361", json=json)
-        if response.status_code != 200:
-            print(response.text)
+        status_code, text = patch_blocking(self.http_adress, "/api/ad9361", json)
+        if status_code != 200:
+            print(text)
             sys.exit(1)
         else:
             return True
@@ -183,9 +183,10 @@ class emitter_finder:
 
 
 def setup_maiasdr(args):
-    response = requests.patch(
-        args.http_address + "/api/ad9361",
-        json={
+    status_code, text = patch_blocking(
+        args.http_address,
+        "/api/ad9361",
+        {
             "sampling_frequency": args.samp_rate,
             "rx_rf_bandwidth": args.bandwidth,
             "rx_lo_frequency": int(args.frequency_range[0]),
@@ -193,22 +194,26 @@ def setup_maiasdr(args):
             "rx_gain_mode": "Manual",
         },
     )
-    if response.status_code != 200:
-        print(response.text)
+    if status_code != 200:
+        print(text)
         sys.exit(1)
-    response = requests.patch(
-        args.http_address + "/api/spectrometer",
-        json={
+    status_code, text = patch_blocking(
+        args.http_address,
+        "/api/spectrometer",
+        {
             "output_sampling_frequency": args.spectrum_rate,
             "mode": "Average",
         },
     )
-    if response.status_code != 200:
-        print(response.text)
+    if status_code != 200:
+        print(text)
         sys.exit(1)
 
 
 async def spectrum_loop(address, finder):
+    # imported here so that the radio setup does not wait for it at startup
+    import websockets
+
     async with websockets.connect(address) as ws:
         while True:
             spec = np.frombuffer(await ws.recv(), "float32")
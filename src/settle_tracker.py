@@ -0,0 +1,54 @@
+"""
+Retune settle tracking for the waterfall frames.
+-------------------
+Every waterfall frame is an average over one spectrum period, so the frames that arrive
+right after a retune still hold energy from the previous LO. The tracker timestamps each
+retune request and its acknowledgement; a frame is clean only if its whole averaging
+period starts after the acknowledgement plus the settle time.
+"""
+
+import time
+
+
+class settle_tracker:
+    def __init__(self, settle_time, frame_period, clock=time.monotonic):
+        self.settle_time = settle_time  # s, PLL lock and filter settle after the ack
+        self.frame_period = frame_period  # s, 1 / spectrum rate
+        self.clock = clock
+
+        self.pending = 0  # retunes requested but not acknowledged yet
+        self.retune_time = None
+        self.acknowledge_time = None
+
+        self.clean_frames = 0
+        self.dropped_frames = 0
+
+    def retune_requested(self):
+        self.pending = self.pending + 1
+        self.retune_time = self.clock()
+
+    def retune_acknowledged(self):
+        self.pending = self.pending - 1
+        self.acknowledge_time = self.clock()
+
+    def settled(self, frame_time):
+        """
+        Whether a frame received at frame_time belongs to the acknowledged LO, without
+        counting it.
+        """
+        return self.pending == 0 and (
+            self.acknowledge_time is None
+            or frame_time - self.frame_period >= self.acknowledge_time + self.settle_time
+        )
+
+    def is_clean(self, frame_time):
+        """
+        Decide whether a frame received at frame_time belongs to the current LO.
+        Counts the frame as clean or dropped.
+        """
+        if not self.settled(frame_time):
+            self.dropped_frames = self.dropped_frames + 1
+            return False
+
+        self.clean_frames = self.clean_frames + 1
+        return True
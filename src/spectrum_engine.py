@@ -0,0 +1,154 @@
+"""
+Spectrum processing engine for the receive loop.
+-------------------
+The waterfall frames are accumulated in linear power into a preallocated float32 buffer,
+so no array is allocated per frame. Only the reduced peak value is converted to dB.
+"""
+
+import functools
+import math
+
+import numpy as np
+
+NO_PEAKS = (np.empty(0), np.empty(0))
+
+
+@functools.lru_cache(maxsize=8)
+def bin_offsets(samp_rate, n_bins):
+    """
+    Frequency offset of each waterfall bin from the LO in Hz. The spectrum is centered,
+    i.e. bin n_bins/2 is the LO. Computed once per (samp_rate, n_bins) and read-only.
+    """
+    offsets = (np.arange(n_bins) - n_bins / 2) * (samp_rate / n_bins)
+    offsets.flags.writeable = False
+    return offsets
+
+
+class spectrum_engine:
+    def __init__(self, n_bins=4096):
+        self.accumulator = np.zeros(n_bins, dtype=np.float32)
+        self.count = 0  # number of frames in the accumulator
+        # scratch buffers of peaks()
+        self.scratch = np.empty(n_bins, dtype=np.float32)
+        self.rising = np.empty(n_bins - 2, dtype=bool)
+        self.falling = np.empty(n_bins - 2, dtype=bool)
+
+    def reset(self):
+        self.count = 0
+
+    def accumulate(self, spec):
+        """
+        Add one linear power frame to the accumulator in place.
+        """
+        if spec.size != self.accumulator.size:
+            self.__init__(spec.size)
+
+        if self.count == 0:
+            np.copyto(self.accumulator, spec)
+        else:
+            np.add(self.accumulator, spec, out=self.accumulator)
+        self.count = self.count + 1
+
+    def peak(self):
+        """
+        Return (bin index, power in dB) of the maximum of the averaged spectrum.
+        """
+        index = int(np.argmax(self.accumulator))
+        return index, 10 * math.log10(max(self.accumulator[index] / self.count, 1e-30))
+
+    def interpolated_peak(self, index=None):
+        """
+        Return (fractional bin index, power in dB) of the maximum of the averaged spectrum,
+        or of the peak at the given bin. A parabola is fitted to the dB values of the peak
+        and its two neighbours, which is a Gaussian fit in linear power.
+        """
+        if index is None:
+            index, peak_power = self.peak()
+        else:
+            peak_power = 10 * math.log10(max(self.accumulator[index] / self.count, 1e-30))
+        if index == 0 or index == self.accumulator.size - 1:
+            return float(index), peak_power
+
+        left, center, right = self.accumulator[index - 1 : index + 2]
+        left = math.log10(max(left, 1e-30))
+        center = math.log10(max(center, 1e-30))
+        right = math.log10(max(right, 1e-30))
+        denominator = left - 2 * center + right
+        if denominator == 0:
+            return float(index), peak_power
+        return index + 0.5 * (left - right) / denominator, peak_power
+
+    def peaks(self, threshold, min_separation=16, max_peaks=8):
+        """
+        Return (fractional bin indices, powers in dB) of the local maxima of the averaged
+        spectrum above threshold (linear power, a scalar or one value per bin), strongest
+        first, at least min_separation bins apart and at most max_peaks of them.
+        """
+        power = self.accumulator
+        inner = power[1:-1]
+        if np.ndim(threshold) == 0:
+            self.scratch.fill(threshold * self.count)
+        else:
+            np.multiply(threshold, np.float32(self.count), out=self.scratch)
+        np.greater(inner, power[:-2], out=self.rising)
+        np.greater_equal(inner, power[2:], out=self.falling)
+        np.logical_and(self.rising, self.falling, out=self.rising)
+        np.greater(inner, self.scratch[1:-1], out=self.falling)
+        np.logical_and(self.rising, self.falling, out=self.rising)
+        if not self.rising.any():
+            return NO_PEAKS
+        candidates = np.flatnonzero(self.rising) + 1
+
+        # strongest first, dropping the maxima closer than min_separation to a stronger one
+        selected = []
+        for index in candidates[np.argsort(power[candidates])[::-1]]:
+            if all(abs(index - other) >= min_separation for other in selected):
+                selected.append(int(index))
+                if len(selected) == max_peaks:
+                    break
+        bins = np.empty(len(selected))
+        powers = np.empty(len(selected))
+        for i, index in enumerate(selected):
+            bins[i], powers[i] = self.interpolated_peak(index)
+        return bins, powers
+
+    def levels(self):
+        """
+        Return (peak, median) of the averaged spectrum in dB, the median over every 16th bin.
+        """
+        peak = float(self.accumulator.max()) / self.count
+        median = float(np.median(self.accumulator[::16])) / self.count
+        return 10 * math.log10(max(peak, 1e-30)), 10 * math.log10(max(median, 1e-30))
+
+    def detect(
+        self, center_freq, threshold_gain, noise=None, min_separation=16, max_peaks=8, gain_offset=0
+    ):
+        """
+        Return (fractional bin index, power in dB, dB above the threshold) of the accumulated
+        hop and the (bins, dB) of all its peaks above the threshold. With a noise_floor the
+        threshold is its per-bin floor (threshold_gain while the floor warms up), and the
+        floor is updated with the hop. gain_offset is the gain of the hop above the reference
+        gain in dB; the returned powers are scaled back to the reference gain.
+        """
+        scale = 1 / self.count
+        cfar_peak = None
+        threshold = None
+        if noise is not None:
+            # a floor measured at another gain does not apply any more
+            noise.set_gain(center_freq, gain_offset)
+            cfar_peak = noise.peak_excess(center_freq, self.accumulator, scale)
+            threshold = noise.thresholds(center_freq)
+        if threshold is None:
+            threshold = 10 ** ((threshold_gain + gain_offset) / 10)
+        peak_bins, peak_powers = self.peaks(threshold, min_separation, max_peaks)
+        if gain_offset:
+            peak_powers = peak_powers - gain_offset
+        if noise is not None:
+            noise.update(center_freq, self.accumulator, scale)
+
+        if cfar_peak is not None:
+            peak_bin, max_power = self.interpolated_peak(cfar_peak[0])
+            return peak_bin, max_power - gain_offset, cfar_peak[1], (peak_bins, peak_powers)
+        peak_bin, max_power = self.interpolated_peak()
+        max_power = max_power - gain_offset
+        return peak_bin, max_power, max_power - threshold_gain, (peak_bins, peak_powers)
@@ -0,0 +1,187 @@
+"""
+Spectrum sources for emitter_finder.
+-------------------
+A source yields (linear power spectrum, frame time) from frames() and has a clock() for the
+settle tracker. A control object has submit(path, payload, on_done) and an async run().
+
+    websocket_source + maia_control    the Maia SDR
+    ring_source                        frames another process writes into a frame_ring
+    replay_source + replay_control     recorded captures (.maiacap, compressed or not) or
+                                       notebooks/data scans (.npz), as fast as the CPU
+                                       allows by default
+
+The replay source keeps a virtual clock that advances one spectrum period per frame, and the
+replay control answers /api/ad9361 retunes by switching the recorded LO after retune_latency
+virtual seconds, so the wide/narrow state machine runs offline exactly as on the radio.
+"""
+
+import asyncio
+import json
+import time
+
+import numpy as np
+
+
+class websocket_source:
+    def __init__(self, address):
+        self.address = address
+        self.clock = time.monotonic
+
+    async def frames(self):
+        # imported here so that the radio setup does not wait for it at startup
+        import websockets
+
+        async with websockets.connect(self.address) as ws:
+            while True:
+                spec = np.frombuffer(await ws.recv(), "float32")
+                yield spec, self.clock()
+
+
+class ring_tee:
+    """
+    Writes every frame of source into a frame_ring, tagged with lo() and gain() (the
+    acknowledged LO and rx_gain) and settled(frame_time), and yields the frame from the ring,
+    so this process and all ring readers see the same copy.
+    """
+
+    def __init__(self, source, ring, lo, settled=None, gain=None):
+        self.source = source
+        self.ring = ring
+        self.lo = lo
+        self.settled = settled
+        self.gain = gain
+        self.clock = source.clock
+
+    async def frames(self):
+        frames = self.source.frames()
+        try:
+            async for spec, frame_time in frames:
+                settled = True if self.settled is None else self.settled(frame_time)
+                gain = None if self.gain is None else self.gain()
+                seq = self.ring.write(spec, self.lo(), frame_time, settled, gain)
+                yield self.ring.frames[seq % self.ring.n_slots], frame_time
+        finally:
+            # closes the websocket here, not in the asyncgen finalizer at loop shutdown
+            await frames.aclose()
+
+
+class ring_source:
+    """
+    Reads the frames of a frame_ring written by another process, e.g. the emitter client.
+    The lo, gain and unix time of the last frame are kept in self.lo, self.gain and
+    self.unix_ns, the samp_rate and spectrum_rate of the radio in self.samp_rate and
+    self.spectrum_rate (None if the writer did not publish them). With settled_only, the
+    frames of the retune settle windows are skipped and counted.
+    """
+
+    def __init__(self, name, start="latest", settled_only=False):
+        from frame_ring import frame_ring, ring_reader
+
+        self.ring = frame_ring(name)
+        self.reader = ring_reader(self.ring, start)
+        self.settled_only = settled_only
+        self.clock = time.monotonic
+        self.samp_rate = self.ring.samp_rate or None
+        self.spectrum_rate = self.ring.spectrum_rate or None
+        self.lo = None
+        self.gain = None
+        self.unix_ns = None
+        self.settling_frames = 0
+
+    async def frames(self):
+        async for _, spec, lo, frame_time, unix_ns, settled, gain in self.reader.frames():
+            if self.settled_only and not settled:
+                self.settling_frames = self.settling_frames + 1
+                continue
+            self.lo = lo
+            self.gain = None if np.isnan(gain) else gain
+            self.unix_ns = unix_ns
+            yield spec, frame_time
+
+
+class replay_source:
+    def __init__(self, filename, spectrum_rate, n_bins=4096, rate=None, max_frames=None):
+        self.spectrum_rate = spectrum_rate
+        self.rate = rate  # frames/s to pace the replay at, None for as fast as possible
+        self.time = 0.0  # virtual clock
+        self.frame_counter = 0
+        self.settings = {}  # last value of each /api/ad9361 key
+        self.acknowledgements = []  # (virtual time, on_done, response) of the pending retunes
+
+        if filename.endswith(".npz"):
+            # notebooks/data scans: one (LO, max dB) pair per hop, turned into flat spectra
+            # at the median level with the recorded peak in the center bin
+            data = np.load(filename)
+            self.los = np.asarray(data["arr_0"], dtype=np.float64)
+            peaks = 10 ** (np.asarray(data["arr_1"], dtype=np.float64) / 10)
+            self.spectra = np.empty((self.los.size, n_bins), dtype=np.float32)
+            self.spectra[:] = np.median(peaks)
+            self.spectra[:, n_bins // 2] = peaks
+            self.hop_records = [np.array([i]) for i in range(self.los.size)]
+            self.max_frames = max_frames
+        else:
+            from capture import open_capture
+
+            capture = open_capture(filename)
+            self.spectra = capture.spectra
+            self.los, inverse = np.unique(capture.lo, return_inverse=True)
+            self.hop_records = [np.flatnonzero(inverse == i) for i in range(self.los.size)]
+            self.max_frames = len(capture) if max_frames is None else max_frames
+
+        self.hop = 0  # index in self.los of the current LO
+        self.cursors = np.zeros(self.los.size, dtype=np.int64)
+
+    def clock(self):
+        return self.time
+
+    def tune(self, lo):
+        """
+        Switch to the recorded LO nearest to lo.
+        """
+        index = int(np.searchsorted(self.los, lo))
+        if index == self.los.size or (index > 0 and lo - self.los[index - 1] < self.los[index] - lo):
+            index = index - 1
+        self.hop = max(index, 0)
+
+    async def frames(self):
+        start = time.perf_counter()
+        while self.max_frames is None or self.frame_counter < self.max_frames:
+            self.time = self.time + 1 / self.spectrum_rate
+            while self.acknowledgements and self.acknowledgements[0][0] <= self.time:
+                _, on_done, text = self.acknowledgements.pop(0)
+                if on_done is not None:
+                    on_done(text)
+
+            records = self.hop_records[self.hop]
+            spec = self.spectra[records[self.cursors[self.hop] % records.size]]
+            self.cursors[self.hop] = self.cursors[self.hop] + 1
+            self.frame_counter = self.frame_counter + 1
+
+            if self.rate is not None:
+                delay = start + self.frame_counter / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield spec, self.time
+
+
+class replay_control:
+    def __init__(self, source, retune_latency=0.0):
+        self.source = source
+        self.retune_latency = retune_latency  # virtual s until a retune is acknowledged
+        self.request_counter = 0
+        self.metrics = None
+
+    def submit(self, path, payload, on_done=None):
+        if path == "/api/ad9361":
+            self.source.settings.update(payload)
+            if "rx_lo_frequency" in payload:
+                self.source.tune(payload["rx_lo_frequency"])
+        self.request_counter = self.request_counter + 1
+        # answered like the radio, with the resulting settings
+        self.source.acknowledgements.append(
+            (self.source.time + self.retune_latency, on_done, json.dumps(self.source.settings))
+        )
+
+    async def run(self):
+        # requests are applied in submit()
+        return
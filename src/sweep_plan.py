@@ -0,0 +1,94 @@
+"""
+Precomputed sweep plans.
+-------------------
+A sweep plan holds the LOs of a wide or narrow sweep, snapped to the 2.4 Hz LO step of the
+AD9361, and for every hop the frequency of each waterfall bin and a trim mask of the bins
+inside the RF bandwidth and the frequency range. The hop spacing follows the bandwidth of the
+mode, the trim mask the RF bandwidth actually applied to the radio, which is capped by the
+analog filter. Plans are built once per (frequency range, bandwidth, overlap, center,
+RF bandwidth) and kept in an LRU cache, so switching between the wide and the narrow mode is a
+lookup instead of an np.arange and a bin map per sweep.
+
+The center of a narrow plan is rounded to center_step, so a track that drifts by a few kHz
+reuses the same plan.
+"""
+
+import collections
+
+import numpy as np
+
+from spectrum_engine import bin_offsets
+
+LO_STEP = 2.4  # Hz, LO granularity of the AD9361
+
+
+def snap(frequency):
+    return round(frequency / LO_STEP) * LO_STEP
+
+
+class sweep_plan:
+    def __init__(self, los, samp_rate, rf_bandwidth, frequency_range, n_bins=4096):
+        self.los = np.array([snap(lo) for lo in los])
+        offsets = bin_offsets(samp_rate, n_bins)
+        self.bin_width = samp_rate / n_bins
+        # frequency of every bin of every hop, and the bins a peak is accepted from
+        self.frequencies = self.los[:, None] + offsets[None, :]
+        self.keep = (np.abs(offsets) <= rf_bandwidth / 2)[None, :] & (
+            (self.frequencies >= frequency_range[0]) & (self.frequencies <= frequency_range[1])
+        )
+        self.frequencies.flags.writeable = False
+        self.keep.flags.writeable = False
+
+    def __len__(self):
+        return self.los.size
+
+
+class plan_cache:
+    def __init__(self, samp_rate, n_bins=4096, max_plans=64, center_step=1e6):
+        self.samp_rate = samp_rate
+        self.n_bins = n_bins
+        self.max_plans = max_plans
+        self.center_step = center_step  # Hz, narrow plan centers are rounded to this
+        self.plans = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, frequency_range, bandwidth, overlap, center=None, rf_bandwidth=None):
+        """
+        Plan with hops bandwidth * overlap apart, over the whole frequency range (center
+        None) or from center - bandwidth / 2 to center + bandwidth. Peaks are kept within
+        rf_bandwidth (default bandwidth) around the LO.
+        """
+        if center is not None:
+            center = round(center / self.center_step) * self.center_step
+        if rf_bandwidth is None:
+            rf_bandwidth = bandwidth
+        key = (frequency_range[0], frequency_range[1], bandwidth, overlap, center, rf_bandwidth)
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.plans.move_to_end(key)
+            self.hits = self.hits + 1
+            return plan
+
+        self.misses = self.misses + 1
+        if center is None:
+            # the last hop is moved back to end at the end of the range, so the range is covered
+            # up to its end without tuning past it
+            los = np.minimum(
+                np.arange(
+                    frequency_range[0] + bandwidth / 2,
+                    frequency_range[1] - bandwidth / 2 + bandwidth * overlap,
+                    bandwidth * overlap,
+                ),
+                frequency_range[1] - bandwidth / 2,
+            )
+        else:
+            los = np.arange(
+                max(center - bandwidth * 0.5, frequency_range[0]),
+                min(center + bandwidth * 1, frequency_range[1]),
+                bandwidth * overlap,
+            )
+        plan = self.plans[key] = sweep_plan(los, self.samp_rate, rf_bandwidth, frequency_range, self.n_bins)
+        if len(self.plans) > self.max_plans:
+            self.plans.popitem(last=False)
+        return plan
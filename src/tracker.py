@@ -0,0 +1,93 @@
+"""
+Multi-emitter tracker.
+-------------------
+Keeps up to max_tracks emitters in fixed numpy arrays (one slot per track) and associates the
+peaks of every sweep with them:
+
+ - each track takes the nearest peak within gate Hz, closest pairs first
+ - peaks within gate of a track that already got one are the same emitter seen from an
+   overlapping hop and are dropped
+ - the remaining peaks start new tracks, strongest first, while there are free slots
+ - a track without a peak coasts, after max_misses sweeps in a row it is lost
+
+Each track has an id that is not reused, so the consumers can follow emitters across sweeps.
+"""
+
+import numpy as np
+
+
+class track_table:
+    def __init__(self, max_tracks=8, gate=1e6, max_misses=5):
+        self.gate = gate  # Hz
+        self.max_misses = max_misses
+
+        self.ids = np.full(max_tracks, -1, dtype=np.int64)  # -1 for a free slot
+        self.frequency = np.zeros(max_tracks)  # Hz
+        self.power = np.zeros(max_tracks)  # dB
+        self.time = np.zeros(max_tracks)  # frame time of the last peak
+        self.hits = np.zeros(max_tracks, dtype=np.int64)
+        self.misses = np.zeros(max_tracks, dtype=np.int64)  # sweeps in a row without a peak
+        self.next_id = 0
+        self.rejected = 0  # peaks dropped because the table was full
+
+    def active(self):
+        return np.flatnonzero(self.ids >= 0)
+
+    def update(self, frequencies, powers, times):
+        """
+        Associate the peaks of one sweep. Return the slots of the detected and the coasting
+        tracks and the (id, frequency, power) of the lost ones, which are freed.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        powers = np.asarray(powers, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        tracks = self.active()
+        used = np.zeros(frequencies.size, dtype=bool)
+        detected = np.zeros(self.ids.size, dtype=bool)
+
+        if tracks.size and frequencies.size:
+            distance = np.abs(self.frequency[tracks, None] - frequencies[None, :])
+            for flat in np.argsort(distance, axis=None):
+                track, peak = divmod(int(flat), frequencies.size)
+                if distance[track, peak] > self.gate:
+                    break
+                slot = tracks[track]
+                if detected[slot] or used[peak]:
+                    continue
+                detected[slot] = True
+                used[peak] = True
+                self.frequency[slot] = frequencies[peak]
+                self.power[slot] = powers[peak]
+                self.time[slot] = times[peak]
+            # the same emitters seen by the neighbouring hops
+            if detected.any():
+                near = np.abs(self.frequency[detected, None] - frequencies[None, :]) <= self.gate
+                used |= near.any(axis=0)
+
+        for peak in np.flatnonzero(~used)[np.argsort(powers[~used])[::-1]]:
+            if used[peak]:
+                continue
+            used |= np.abs(frequencies - frequencies[peak]) <= self.gate
+            free = np.flatnonzero(self.ids < 0)
+            if free.size == 0:
+                self.rejected = self.rejected + 1
+                continue
+            slot = free[0]
+            self.ids[slot] = self.next_id
+            self.next_id = self.next_id + 1
+            self.hits[slot] = 0
+            self.misses[slot] = 0
+            self.frequency[slot] = frequencies[peak]
+            self.power[slot] = powers[peak]
+            self.time[slot] = times[peak]
+            detected[slot] = True
+
+        self.hits[detected] = self.hits[detected] + 1
+        self.misses[detected] = 0
+        missed = (self.ids >= 0) & ~detected
+        self.misses[missed] = self.misses[missed] + 1
+
+        lost_slots = np.flatnonzero(missed & (self.misses >= self.max_misses))
+        lost = [(int(self.ids[slot]), self.frequency[slot], self.power[slot]) for slot in lost_slots]
+        self.ids[lost_slots] = -1
+        return np.flatnonzero(detected), np.flatnonzero((self.ids >= 0) & ~detected), lost